@@ -0,0 +1,25 @@
+# Atomic file replacement, shared by process_xdc.py and profiling.py
+#
+# Everything the generators write is read by something else (Stanza, a dashboard, the next run's cache or
+# up-to-date check), so files are written to a temporary name next to the target and moved over it in one
+# go.  A reader sees the old contents or the new ones, never half a file.
+
+from contextlib import contextmanager
+import os
+
+@contextmanager
+def atomicWrite(path, mode='w', **kwargs):
+    # with atomicWrite(path) as f: ... writes f to a temporary file and replaces path with it once the block
+    # is done.  kwargs go to open().  If the block raises, the temporary file is removed and path left alone
+    tmp_path = '%s.%u.tmp' % (path, os.getpid())
+    f = open(tmp_path, mode, **kwargs)
+    try:
+        with f:
+            yield f
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    os.replace(tmp_path, path)
@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+"""
+Scaling benchmark for the process_xdc.py pipeline.
+
+Generates synthetic constraint sets of increasing size (vector ports with [*] wildcards, LVDS diff pairs,
+UART and I2C groups, plain pins) together with a matching ***pkg.csv pinout, runs every phase of the
+pipeline over them and reports the time spent in each phase and the peak memory of the run.  Each size
+runs in a fresh worker process so that the peak memory figures don't carry over from one size to the next.
+
+    bench_xdc.py [--sizes 500,5000,100000] [--files 8] [--json results.json] [--keep DIR]
+"""
+
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+import argparse
+import itertools
+import json
+import os
+import os.path
+import random
+import resource
+import shutil
+import sys
+import tempfile
+
+import process_xdc
+from pinout import PackagePinout
+from profiling import PhaseProfiler
+
+default_sizes = (500, 2000, 10000, 50000, 100000)
+csv_name = "benchpkg.csv"
+
+phases = ("discovery", "csv-read", "tokenize", "wildcards", "filter", "bundles", "iostandard", "banks", "csv-merge",
+          "emission")
+
+def padNames():
+    # Ball names in the Xilinx style: row letters (skipping I, O, Q, S, X, Z) then column number
+    letters = "ABCDEFGHJKLMNPRTUVWY"
+    for length in range(1, 4):
+        for row in itertools.product(letters, repeat=length):
+            for col in range(1, 60):
+                yield "%s%u" % ("".join(row), col)
+
+def generateFixture(directory, n_lines, n_files=8, seed=0):
+    # Write about n_lines of constraints spread over n_files xdc files, plus a pinout with a pad for every pin
+    # Returns the number of constraint lines written
+    rnd = random.Random(seed)
+    pads = padNames()
+    files = [[] for i in range(n_files)]
+    io_pads = []
+    n_written = 0
+    group = 0
+
+    def place(lines, port):
+        pad = next(pads)
+        io_pads.append(pad)
+        lines.append("set_property PACKAGE_PIN %s [get_ports %s]" % (pad, port))
+
+    while n_written < n_lines:
+        lines = files[group % n_files]
+        start = len(lines)
+        kind = rnd.random()
+        if kind < 0.3:
+            # Vector port with a wildcard IOSTANDARD and the odd per-index override
+            width = rnd.choice((4, 8, 16, 32))
+            name = "BUS%u_AD" % group
+            for i in range(width):
+                place(lines, "{%s[%u]}" % (name, i))
+            lines.append("set_property IOSTANDARD LVCMOS18 [get_ports {%s[*]}]" % name)
+            lines.append("set_property SLEW FAST [get_ports {%s[%u]}]" % (name, rnd.randrange(width)))
+        elif kind < 0.5:
+            name = rnd.choice(("lvds_link%u", "aurora_%u_clk", "ddr3_dqs_%u")) % group
+            place(lines, name + "_p")
+            place(lines, name + "_m")
+            if name.startswith("lvds"):
+                lines.append("set_property IOSTANDARD LVDS [get_ports %s_p]" % name)
+        elif kind < 0.6:
+            name = "pod_%u" % group
+            for suffix in ("_tx", "_rx", "_tx_en"):
+                place(lines, name + suffix)
+                lines.append("set_property IOSTANDARD LVCMOS33 [get_ports %s%s]" % (name, suffix))
+        elif kind < 0.7:
+            name = "i2c_%u" % group
+            for suffix in ("_scl", "_sda"):
+                place(lines, "{%s%s}" % (name, suffix))
+        else:
+            name = "gpio_%u" % group
+            place(lines, name)
+            lines.append("set_property IOSTANDARD %s [get_ports %s]" % (rnd.choice(("LVCMOS18", "LVCMOS33")), name))
+            if rnd.random() < 0.3:
+                lines.append("set_property DRIVE 12 [get_ports %s]" % name)
+        if rnd.random() < 0.1:
+            lines.append("# group %u" % group)
+        n_written += len(lines) - start
+        group += 1
+
+    for i, lines in enumerate(files):
+        f = open(os.path.join(directory, "bench%u.xdc" % i), "w")
+        f.write("\n".join(lines) + "\n")
+        f.close()
+
+    # Pinout: the constrained pads in banks of 52, each bank with its VCCO and VREF, then some spare
+    # I/O and power pins which only come in through the csv merge
+    f = open(os.path.join(directory, csv_name), "w")
+    f.write("Pin,Pin Name,Memory Byte Group,Bank,I/O Type,Super Logic Region\n")
+    spare = [next(pads) for i in range(len(io_pads) // 10 + 52)]
+    for i, pad in enumerate(io_pads + spare):
+        bank = 44 + i // 52
+        f.write("%s,IO_L%uP_T0U_N%u_%u,NA,%u,HP,NA\n" % (pad, i % 52, i % 52, bank, bank))
+        if i % 52 == 51:
+            f.write("%s,VCCO_%u,NA,%u,NA,NA\n" % (next(pads), bank, bank))
+            f.write("%s,VREF_%u,NA,%u,HP,NA\n" % (next(pads), bank, bank))
+    for net, count in (("GND", len(io_pads) // 8 + 10), ("VCCINT", 12), ("VCCAUX", 6), ("VCCBRAM", 4)):
+        for i in range(count):
+            f.write("%s,%s,NA,NA,NA,NA\n" % (next(pads), net))
+    f.close()
+    return n_written
+
+def runPipeline(directory):
+    # Run the process_xdc.py pipeline over a generated fixture with its phase profiler
+    # Returns ({phase: wall seconds}, the profiler's counters)
+    profiler = PhaseProfiler(directory)
+    profiler.start()
+    with profiler.phase("discovery"):
+        fnames = process_xdc.findXDCFiles(directory)
+    with profiler.phase("csv-read"):
+        pinout = PackagePinout(os.path.join(directory, csv_name))
+    process_xdc.generate(fnames, pinout, os.path.join(directory, "bench-cmp.stanza"), profiler=profiler)
+    profiler.stop()
+    return dict((name, wall) for name, wall, cpu in profiler.phases), dict(profiler.counts)
+
+def benchOne(job):
+    # Worker: generate one size, time the pipeline over it and report the peak RSS of this process
+    n_lines, n_files, keep = job
+    directory = tempfile.mkdtemp(prefix="bench_xdc_%u_" % n_lines)
+    try:
+        n_written = generateFixture(directory, n_lines, n_files)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            timings, counts = runPipeline(directory)
+        if keep:
+            shutil.copytree(directory, os.path.join(keep, "%u" % n_lines), dirs_exist_ok=True)
+    finally:
+        shutil.rmtree(directory)
+    # ru_maxrss is in KiB on Linux
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"lines": n_written, "pins": counts["pins"], "phases": timings, "counts": counts,
+            "total": sum(timings.values()), "peak-rss-mib": peak_kib / 1024.0}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each phase of process_xdc.py on synthetic constraint sets")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in default_sizes),
+                        help="comma separated constraint line counts")
+    parser.add_argument("--files", type=int, default=8, help="number of xdc files to spread the constraints over")
+    parser.add_argument("--json", help="also write the results here")
+    parser.add_argument("--keep", help="copy the generated fixtures into this directory")
+    args = parser.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    results = []
+    header = "%8s %7s" % ("lines", "pins") + "".join(" %10s" % p for p in phases) + " %9s %9s" % ("total", "peak MiB")
+    print(header)
+    for n_lines in sizes:
+        # A fresh process per size keeps ru_maxrss meaningful
+        with Pool(1) as pool:
+            result = pool.apply(benchOne, ((n_lines, args.files, args.keep),))
+        results.append(result)
+        print("%8u %7u" % (result["lines"], result["pins"]) +
+              "".join(" %8.1fms" % (result["phases"][p] * 1000) for p in phases) +
+              " %7.1fms %9.1f" % (result["total"] * 1000, result["peak-rss-mib"]))
+        sys.stdout.flush()
+    if args.json:
+        f = open(args.json, "w")
+        json.dump(results, f, indent=2)
+        f.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,37 @@
 # Generates a function to add bypass capacitors to an FPGA according to ug583-bypassing.csv
 # Presently just uses xcku060ffva1517pkg.csv to figure out the power rails
 # Supply other xilinx provided ***pkg.csv files to generate bypassing for other part numbers
+#
+# Usage: gen-bypass.py [PART ...] [--all] [-o OUTPUT] [-j JOBS] [--pkg-dir DIR] [--profile [--cprofile]]
+# With no arguments the xcku060ffva1517 function is printed to stdout.  In batch mode (several parts,
+# or --all for every part in ug583-bypassing.csv) the ***pkg.csv files are parsed in a pool of worker
+# processes and one bypass-<pn> function per part is written to OUTPUT.
+# --profile writes per-phase timings and counters to OUTPUT.profile.json (gen-bypass.profile.json
+# when writing to stdout).
+# --bom FILE writes the capacitor bill of materials for the given parts (every part by default) to FILE
+# as csv instead: capacitors per part, per rail and per capacitor value, computed with NumPy.
 
-from collections import defaultdict
+from collections import Counter, defaultdict
+from multiprocessing import Pool
+import argparse
+import csv
+import os.path
+import sys
+import time
+from pinout import PinoutFile, stanzifyName
+from profiling import NullProfiler, PhaseProfiler, profilePaths
+from writer import Writer
 
-part_numbers_to_process = ("xcku060ffva1517",)
+# NumPy is only needed for --bom
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+default_part_numbers = ("xcku060ffva1517",)
+
+# The ug583 table ships next to this script, so it is found whatever the working directory
+default_bypass_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ug583-bypassing.csv")
 
 def readCSV(fname):
     f = open(fname)
@@ -13,8 +40,11 @@ def readCSV(fname):
     rows = [[entry.strip() for entry in line.split(',')] for line in lines]
     return rows
 
-def readBypassCapTable():
-    fname = "ug583-bypassing.csv"
+def readBypassCapTable(fname=default_bypass_csv):
+    # Key:   Part number:string
+    # Value: Dict:
+    #       Key:   (rail name:string, cap value:float)
+    #       Value: Number of capacitors:int
     rows = readCSV(fname)
     # First 2 rows are headers
     # First row is name of the rail to put a capacitor on
@@ -42,88 +72,269 @@ def readBypassCapTable():
         for i in range(1,len(row)):
             rval[pn][cap_designations[i]] = int(row[i])
     return rval
-# Key:   Part number:string
-# Value: Dict:
-#       Key:   (rail name:string, cap value:float)
-#       Value: Number of capacitors:int
-bypass_cap_table = readBypassCapTable()
-print(bypass_cap_table)
-
-def readRailsForPart(pn):
-    csv_name = pn+"pkg.csv"
-    rows = readCSV(csv_name)
-    header = rows.pop(0)
-    rail_names = [k[0] for k in bypass_cap_table[pn].keys()]
+
+# Pins whose rail isn't named by a prefix of their pin name: pin name prefix => function giving the rail name
+# from the pin's I/O type.  The rail is that or nothing, the pin name prefixes aren't tried for these pins.
+special_rail_rules = [
+    # The HXIO rails are all labeled VREF_NN where NN is an index, the rail is named after the I/O type
+    ("VREF", lambda io_type: io_type+"IO"),
+]
+
+class RailClassifier(object):
+    # Decides which of a part's bypassed rails a pinout row's pin is on: the first rail (in ug583 column order)
+    # whose name is a prefix of the pin name.  Rail names are looked up by every distinct rail name length
+    # instead of trying each rail in turn, and each distinct pin name is only classified once.
+    def __init__(self, rail_names):
+        self.order = {}
+        for name in rail_names:
+            self.order.setdefault(name, len(self.order))
+        self.lengths = sorted(set(len(name) for name in self.order))
+        self.known = {}
+
+    def classifyName(self, pin_name):
+        rval = None
+        for length in self.lengths:
+            if length > len(pin_name):
+                break
+            name = pin_name[:length]
+            if name in self.order and (rval is None or self.order[name] < self.order[rval]):
+                rval = name
+        return rval
+
+    def classify(self, pin_name, io_type):
+        for prefix, rule in special_rail_rules:
+            if pin_name.startswith(prefix):
+                rail_name = rule(io_type)
+                return rail_name if rail_name in self.order else None
+        if pin_name not in self.known:
+            self.known[pin_name] = self.classifyName(pin_name)
+        return self.known[pin_name]
+
+def groupRails(rails):
+    # pin name => rail table from readRailsForPart as rail => pin names
+    rval = defaultdict(list)
+    for pin_name, rail in rails.items():
+        rval[rail].append(pin_name)
+    return rval
+
+# caps is the part's entry in the readBypassCapTable table: (rail name, cap value) => number of capacitors
+def readRailsForPart(pn, caps, pkg_dir=".", counts=None):
+    # Only the pin name and I/O type columns are decoded
+    pinout_file = PinoutFile(os.path.join(pkg_dir, pn+"pkg.csv"))
+    pin_names, io_types = pinout_file.columns(["pin-name", "i/o-type"])
+    pinout_file.close()
+    if counts is not None:
+        counts['csv-rows-read'] += len(pin_names)
+    classifier = RailClassifier(k[0] for k in caps.keys())
     rval = {}
-    for row in rows:
-        pin_name = row[1]
-        rail_name = None
-        # Special case: the HXIO rails are all labeled VREF_NN where NN is an index
-        if pin_name.startswith("VREF"):
-            test_name = row[4]+"IO"
-            if test_name in rail_names:
-                rail_name = test_name
-        else:
-            for test_name in rail_names:
-                if pin_name.startswith(test_name):
-                    rail_name = test_name
-                    break
+    for pin_name, io_type in zip(pin_names, io_types):
+        rail_name = classifier.classify(pin_name, io_type)
         if rail_name is not None:
             rval[pin_name] = rail_name
+    if counts is not None:
+        counts['rail-pins'] += len(rval)
     return rval
 
-# Key:   Part number:string
-# Value: Dictionary
-#       Key:   Pin name (string)
-#       Value: Rail to apply bypass caps from (String)
-pin_table = {}
-for pn in part_numbers_to_process:
-    pin_table[pn] = readRailsForPart(pn)
-
-class Indenter(object):
-    def __init__(self):
-        self.__indent = 0
-    def indent(self):
-        self.__indent += 1
-    def undent(self):
-        self.__indent -= 1
-    def print(self, *args):
-        print(("  " * self.__indent), *args)
-
-def stanzifyName(s):
-    s = s.replace('_','-')
-    s = s.replace(' ', '-')
-    s = s.lower()
-    return s
-
-def generateBypassModule(pn):
-    printer = Indenter()
-    printer.print("defn bypass-%s (cmp:Ref):"%pn)
+# rails is the pin name => rail table returned by readRailsForPart
+def generateBypassModule(pn, caps, rails, printer):
+    printer.printLine("defn bypass-%s (cmp:Ref):"%pn)
     printer.indent()
-    printer.print("inside pcb-module:")
+    printer.printLine("inside pcb-module:")
     printer.indent()
-    caps = bypass_cap_table[pn]
-    rails = pin_table[pn]
+    rail_pins = groupRails(rails)
     # Key: (pin-name, size)
     # Value: stanza statement
     gen_cap_stmts = {}
-    for (outer_rail, size), q in caps.items():
-        for unstanzified_pin_name, inner_rail in rails.items():
-            if outer_rail == inner_rail:
-                pin_name = stanzifyName(unstanzified_pin_name)
-                gen_cap_stmt = "cap-strap(cmp.%s, cmp.gnd, %0.1f)"%(pin_name,size)
-                if q == 0:
-                    continue
-                elif q == 1:
-                    pass
-                if q >= 2:
-                    gen_cap_stmt = "for i in 0 to %u do: "%q + gen_cap_stmt
-                gen_cap_stmts[pin_name, size] = gen_cap_stmt
+    for (rail, size), q in caps.items():
+        if q == 0:
+            continue
+        for unstanzified_pin_name in rail_pins.get(rail, ()):
+            pin_name = stanzifyName(unstanzified_pin_name)
+            gen_cap_stmt = "cap-strap(cmp.%s, cmp.gnd, %0.1f)"%(pin_name,size)
+            if q >= 2:
+                gen_cap_stmt = "for i in 0 to %u do: "%q + gen_cap_stmt
+            gen_cap_stmts[pin_name, size] = gen_cap_stmt
     sorted_keys = sorted(gen_cap_stmts.keys())
     for key in sorted_keys:
-        printer.print(gen_cap_stmts[key])
-    printer.undent() # inside pcb-module
-    printer.undent() # function def
+        printer.printLine(gen_cap_stmts[key])
+    printer.unindent() # inside pcb-module
+    printer.unindent() # function def
+
+def processPart(job):
+    # Worker for batch mode: parse one part's pinout and render its bypass function
+    # Returns (part number, generated text or None if the pinout is missing, wall time in seconds,
+    # [(phase, wall, cpu seconds)] and counters for the profile report)
+    pn, caps, pkg_dir = job
+    counts = defaultdict(int)
+    start = time.perf_counter(), time.process_time()
+    try:
+        rails = readRailsForPart(pn, caps, pkg_dir, counts)
+    except FileNotFoundError:
+        return pn, None, time.perf_counter() - start[0], [], {}
+    parsed = time.perf_counter(), time.process_time()
+    printer = Writer()
+    generateBypassModule(pn, caps, rails, printer)
+    counts['statements-emitted'] += len(printer.lines)
+    end = time.perf_counter(), time.process_time()
+    phases = [('read-pinout', parsed[0] - start[0], parsed[1] - start[1]),
+              ('generate', end[0] - parsed[0], end[1] - parsed[1])]
+    return pn, printer.getvalue(), end[0] - start[0], phases, counts
+
+def generateBatch(cap_table, part_numbers, output, pkg_dir=".", jobs=None, profiler=None):
+    # Generate bypass functions for many parts in parallel, writing them to output in the order given
+    # Each worker is handed its part's capacitor table along with the part number
+    # Returns a list of (part number, wall time) for the parts that were generated
+    if profiler is None:
+        profiler = NullProfiler()
+    timings = []
+    start = time.perf_counter()
+    with Pool(jobs) as pool:
+        for pn, text, elapsed, phases, counts in pool.imap(processPart, [(pn, cap_table[pn], pkg_dir) for pn in part_numbers]):
+            if text is None:
+                print("No pinout %s found for %s, skipping" % (pn + "pkg.csv", pn), file=sys.stderr)
+                profiler.count('parts-skipped')
+                continue
+            output.write(text)
+            timings.append((pn, elapsed))
+            profiler.count('parts')
+            profiler.addCounts(counts)
+            for phase, wall, cpu in phases:
+                profiler.record("%s:%s" % (pn, phase), wall, cpu)
+    print("Generated %u of %u parts in %0.3fs" % (len(timings), len(part_numbers), time.perf_counter() - start), file=sys.stderr)
+    for pn, elapsed in timings:
+        print("  %-20s %0.3fs" % (pn, elapsed), file=sys.stderr)
+    return timings
+
+def railPinCountsJob(job):
+    # Worker for bypassBOM: number of power pin names on each bypassed rail of one part, None without a pinout
+    pn, caps, pkg_dir = job
+    try:
+        rails = readRailsForPart(pn, caps, pkg_dir)
+    except FileNotFoundError:
+        return pn, None
+    return pn, Counter(rails.values())
+
+class BypassBOM(object):
+    # Capacitor counts for a set of parts, all as NumPy arrays:
+    #   counts[part, column]      capacitors of columns[column] = (rail, size) on each part
+    #   per_rail[part, rail]      totals over the capacitor sizes of each rail in rails
+    #   per_value[part, value]    totals over the rails for each capacitor size in values
+    #   per_part[part]            totals for each part
+    def __init__(self, part_numbers, columns, counts):
+        self.part_numbers = part_numbers
+        self.columns = columns
+        self.counts = counts
+        self.rails = sorted(set(rail for rail, size in columns))
+        self.values = sorted(set(size for rail, size in columns), reverse=True)
+        # 0/1 matrices folding the columns onto rails and onto values
+        to_rail = numpy.zeros((len(columns), len(self.rails)), dtype=numpy.int64)
+        to_value = numpy.zeros((len(columns), len(self.values)), dtype=numpy.int64)
+        for i, (rail, size) in enumerate(columns):
+            to_rail[i, self.rails.index(rail)] = 1
+            to_value[i, self.values.index(size)] = 1
+        self.per_rail = counts @ to_rail
+        self.per_value = counts @ to_value
+        self.per_part = counts.sum(axis=1)
+
+    def writeCSV(self, f):
+        # One row per part and a TOTAL row for the whole set
+        out = csv.writer(f, lineterminator='\n')
+        out.writerow(["part", "total"] + self.rails + ["%guF" % size for size in self.values])
+        for i, pn in enumerate(self.part_numbers):
+            out.writerow([pn, self.per_part[i]] + list(self.per_rail[i]) + list(self.per_value[i]))
+        out.writerow(["TOTAL", self.per_part.sum()] + list(self.per_rail.sum(axis=0)) + list(self.per_value.sum(axis=0)))
+
+def bypassBOM(cap_table, part_numbers, pkg_dir=".", jobs=None):
+    # Capacitor counts for every given part with a pinout in pkg_dir, the same counts the generated
+    # bypass functions place: ug583 quantity x number of power pin names on the rail
+    if numpy is None:
+        raise RuntimeError("The bypass BOM needs NumPy (pip install numpy)")
+    columns = []
+    for caps in cap_table.values():
+        columns.extend(k for k in caps if k not in columns)
+    rails = sorted(set(rail for rail, size in columns))
+    column_rail = numpy.array([rails.index(rail) for rail, size in columns], dtype=numpy.intp)
+
+    found = []
+    with Pool(jobs) as pool:
+        for pn, pin_counts in pool.imap(railPinCountsJob, [(pn, cap_table[pn], pkg_dir) for pn in part_numbers]):
+            if pin_counts is None:
+                print("No pinout %s found for %s, skipping" % (pn + "pkg.csv", pn), file=sys.stderr)
+                continue
+            found.append((pn, pin_counts))
+    # parts x columns ug583 quantities and parts x rails pin counts
+    quantities = numpy.array([[cap_table[pn].get(k, 0) for k in columns] for pn, _ in found],
+                             dtype=numpy.int64).reshape(len(found), len(columns))
+    pins = numpy.array([[pin_counts.get(rail, 0) for rail in rails] for _, pin_counts in found],
+                       dtype=numpy.int64).reshape(len(found), len(rails))
+    return BypassBOM([pn for pn, _ in found], columns, quantities * pins[:, column_rail])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate FPGA bypass capacitor functions from ug583-bypassing.csv")
+    parser.add_argument("parts", nargs="*", help="part numbers to generate, e.g. xcku060ffva1517")
+    parser.add_argument("--all", action="store_true", help="generate every part listed in ug583-bypassing.csv")
+    parser.add_argument("-o", "--output", help="file to write the generated functions to")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--pkg-dir", default=".", help="directory holding the ***pkg.csv files")
+    parser.add_argument("--bypass-csv", default=default_bypass_csv,
+                        help="capacitors per rail and part, ug583-bypassing.csv next to this script by default")
+    parser.add_argument("--profile", action="store_true", help="write per-phase timings and counters next to the output")
+    parser.add_argument("--cprofile", action="store_true", help="with --profile, also dump cProfile stats of the run")
+    parser.add_argument("--bom", help="write the capacitor bill of materials (every part unless some are given) to this csv")
+    args = parser.parse_args(argv)
+
+    report_path, cprofile_path = profilePaths(args.output or "gen-bypass")
+    if args.profile:
+        profiler = PhaseProfiler(args.output or "gen-bypass", cprofile_path if args.cprofile else None)
+    else:
+        profiler = NullProfiler()
+    profiler.start()
+
+    try:
+        bypass_cap_table = readBypassCapTable(args.bypass_csv)
+    except OSError as e:
+        parser.error("can't read the bypassing table: %s" % e)
+    if args.all or (args.bom and not args.parts):
+        part_numbers = sorted(bypass_cap_table.keys())
+    else:
+        part_numbers = args.parts or list(default_part_numbers)
+    unknown = [pn for pn in part_numbers if pn not in bypass_cap_table]
+    if unknown:
+        parser.error("No bypassing data for %s" % ", ".join(unknown))
+
+    if args.bom:
+        with profiler.phase('bom'):
+            bom = bypassBOM(bypass_cap_table, part_numbers, args.pkg_dir, args.jobs)
+            with open(args.bom, "w", newline="") as f:
+                bom.writeCSV(f)
+        profiler.count('parts', len(bom.part_numbers))
+        print("Wrote capacitor counts for %u of %u parts to %s" % (len(bom.part_numbers), len(part_numbers), args.bom),
+              file=sys.stderr)
+    elif args.output is None and not args.all and len(part_numbers) == 1:
+        # Single part, same as always: straight to stdout
+        pn = part_numbers[0]
+        print(bypass_cap_table)
+        printer = Writer(sys.stdout)
+        counts = defaultdict(int)
+        with profiler.phase('read-pinout'):
+            rails = readRailsForPart(pn, bypass_cap_table[pn], args.pkg_dir, counts)
+        with profiler.phase('generate'):
+            generateBypassModule(pn, bypass_cap_table[pn], rails, printer)
+        counts['statements-emitted'] += len(printer.lines)
+        profiler.addCounts(counts)
+        profiler.count('parts')
+        with profiler.phase('emission'):
+            printer.flush()
+    elif args.output is None:
+        with profiler.phase('batch'):
+            generateBatch(bypass_cap_table, part_numbers, sys.stdout, args.pkg_dir, args.jobs, profiler)
+    else:
+        with profiler.phase('batch'), open(args.output, "w") as f:
+            generateBatch(bypass_cap_table, part_numbers, f, args.pkg_dir, args.jobs, profiler)
+    profiler.stop()
+    if args.profile:
+        profiler.write(report_path)
+        print("Wrote %s" % report_path, file=sys.stderr)
 
-for pn in part_numbers_to_process:
-    generateBypassModule(pn)
+if __name__ == "__main__":
+    main()
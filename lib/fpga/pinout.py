@@ -0,0 +1,149 @@
+# Indexed view of a Xilinx ***pkg.csv package pinout file
+# The file is parsed once and every lookup the generator scripts make goes through a hash index
+#
+# PinoutFile is the loader underneath: it memory-maps the file and only splits out and decodes the columns
+# somebody asks for, in one pass over the mapping per batch of columns.  Scripts needing a couple of
+# columns of many pinouts (gen-bypass.py) use it directly, PackagePinout decodes every column into its indexes.
+
+from array import array
+from collections import defaultdict
+import mmap
+
+def stanzifyName(s):
+    s = s.replace('_','-')
+    s = s.replace(' ', '-')
+    s = s.lower()
+    return s
+
+def isPowerNet(pin_name):
+    return any(x in pin_name for x in ('GND', 'VCC', 'VTT'))
+
+class PinoutFile(object):
+    def __init__(self, fname):
+        self.fname = fname
+        f = open(fname, 'rb')
+        try:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file, which can't be mapped
+            self.data = b''
+        f.close()
+        # The header is the first line, rows are every non-empty line after it
+        header_end = self.data.find(b'\n')
+        if header_end < 0:
+            header_end = len(self.data)
+        self.header = [stanzifyName(x.strip()) for x in self.data[:header_end].decode().split(',')]
+        # Where each row starts and ends in the mapping, found once here; fields are only sliced out of the
+        # mapping a row at a time when columns() asks for them
+        self.row_starts = array('q')
+        self.row_ends = array('q')
+        self.__scanRows(header_end + 1)
+        # stanzified column name => list of its stripped fields, '' where a row is short
+        self.decoded = {}
+
+    def __scanRows(self, pos):
+        data = self.data
+        size = len(data)
+        while pos < size:
+            end = data.find(b'\n', pos)
+            if end < 0:
+                end = size
+            line_end = end
+            if line_end > pos and data[line_end - 1] == 0x0d:
+                line_end -= 1
+            if line_end > pos:
+                self.row_starts.append(pos)
+                self.row_ends.append(line_end)
+            pos = end + 1
+
+    def __len__(self):
+        return len(self.row_starts)
+
+    def columns(self, names):
+        # Fields of the named columns for every row, decoding whichever aren't decoded yet in one pass
+        todo = [name for name in names if name not in self.decoded]
+        if todo:
+            indices = [self.header.index(name) for name in todo]
+            n_split = max(indices) + 1
+            values = [[] for name in todo]
+            data = self.data
+            for start, end in zip(self.row_starts, self.row_ends):
+                # Fields after the last one wanted are left unsplit
+                fields = data[start:end].split(b',', n_split)
+                for i, column in zip(indices, values):
+                    column.append(fields[i].strip().decode() if i < len(fields) else '')
+            for name, column in zip(todo, values):
+                self.decoded[name] = column
+        return [self.decoded[name] for name in names]
+
+    def column(self, name):
+        return self.columns([name])[0]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = b''
+
+class PackagePinout(object):
+    def __init__(self, fname):
+        self.fname = fname
+        # Key:   pad name:string (e.g. "AE7")
+        # Value: Dict:
+        #       Key:   stanzified column name:string (e.g. "pin-name", "bank", "i/o-type")
+        #       Value: non-empty field:string
+        self.rows = {}
+        # pin name / bank / VCCO rail / power net => pad names, in file order
+        self.by_pin_name = defaultdict(list)
+        self.by_bank = defaultdict(list)
+        self.by_vcco = defaultdict(list)
+        self.by_power_net = defaultdict(list)
+        pinout_file = PinoutFile(fname)
+        self.header = pinout_file.header
+        for fields in zip(*pinout_file.columns(self.header)):
+            self.__addRow(fields)
+        pinout_file.close()
+
+    def __addRow(self, fields):
+        pad = fields[0]
+        if not pad:
+            return
+        row = {}
+        for key, field in zip(self.header, fields):
+            if field:
+                row[key] = field
+        self.rows[pad] = row
+        pin_name = row.get('pin-name', '')
+        self.by_pin_name[pin_name].append(pad)
+        if 'bank' in row:
+            self.by_bank[row['bank']].append(pad)
+        if pin_name.startswith('VCCO_'):
+            self.by_vcco[pin_name].append(pad)
+        if isPowerNet(pin_name):
+            self.by_power_net[pin_name].append(pad)
+
+    def __contains__(self, pad):
+        return pad in self.rows
+
+    def row(self, pad):
+        return self.rows[pad]
+
+    def pinName(self, pad):
+        return self.rows[pad]['pin-name']
+
+    def bank(self, pad):
+        return self.rows[pad].get('bank')
+
+    def pads(self, pin_name):
+        return self.by_pin_name.get(pin_name, [])
+
+    def bankPads(self, bank):
+        return self.by_bank.get(bank, [])
+
+    def vccoPads(self, rail):
+        return self.by_vcco.get(rail, [])
+
+    def powerNets(self):
+        return list(self.by_power_net.keys())
+
+    def powerPads(self, net):
+        return self.by_power_net.get(net, [])
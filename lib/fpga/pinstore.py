@@ -0,0 +1,193 @@
+# Compact storage for the per-pin properties gathered by process_xdc.py
+#
+# Every pin gets an integer id.  Property values live in one list per property name (a column) indexed
+# by pin id, and each pin keeps the ids of the properties it has, in the order they were set, as a short
+# bytes string.  Property names and string values are interned, so the thousands of copies of
+# LVCMOS18, NA or a bank number are one object each.
+#
+# A PinTable maps (pinname, index) pinrefs onto PinRecord views of those columns and behaves like the
+# defaultdict of dicts it replaces, so table[pinref][propname] = value still works.
+
+from collections.abc import MutableMapping
+import sys
+
+# Property name schema shared by every table in the process.  The columns we always see come first so
+# that they get the same small ids everywhere; anything else (SLEW, DRIVE, ...) is appended on first use.
+property_names = ['PACKAGE_PIN', 'IOSTANDARD', 'family', 'voltage',
+                  'pin', 'pin-name', 'memory-byte-group', 'bank', 'i/o-type', 'super-logic-region', 'no-connect']
+property_ids = dict((name, i) for i, name in enumerate(property_names))
+
+def propertyId(name):
+    if name not in property_ids:
+        property_ids[name] = len(property_names)
+        property_names.append(sys.intern(name))
+    return property_ids[name]
+
+def internValue(value):
+    # Property values repeat endlessly (LVCMOS18, bank numbers, ...), keep one copy of each string
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+def hasId(order, i):
+    # bytes orders only ever hold ids below 256, and `in` on bytes raises for anything bigger
+    if isinstance(order, bytes) and i >= 256:
+        return False
+    return i in order
+
+def appendId(order, i):
+    # Property orders are bytes while every id fits in one, tuples beyond that
+    if i < 256 and isinstance(order, bytes):
+        return order + bytes((i,))
+    return tuple(order) + (i,)
+
+def removeId(order, i):
+    if isinstance(order, bytes):
+        if i >= 256:
+            return order
+        return order.replace(bytes((i,)), b'')
+    return tuple(x for x in order if x != i)
+
+class PinRecord(MutableMapping):
+    # View of the properties of one pin, in the order they were first set
+    __slots__ = ('_table', '_id')
+
+    def __init__(self, table, pin_id):
+        self._table = table
+        self._id = pin_id
+
+    def __getitem__(self, name):
+        i = property_ids.get(name)
+        if i is None or not hasId(self._table.orders[self._id], i):
+            raise KeyError(name)
+        return self._table.columns[i][self._id]
+
+    def __setitem__(self, name, value):
+        table = self._table
+        pin_id = self._id
+        i = propertyId(name)
+        order = table.orders[pin_id]
+        if not hasId(order, i):
+            table.orders[pin_id] = appendId(order, i)
+        while len(table.columns) <= i:
+            table.columns.append([])
+        column = table.columns[i]
+        if len(column) <= pin_id:
+            column.extend([None] * (pin_id + 1 - len(column)))
+        column[pin_id] = internValue(value)
+
+    def __delitem__(self, name):
+        table = self._table
+        i = property_ids.get(name)
+        if i is None or not hasId(table.orders[self._id], i):
+            raise KeyError(name)
+        table.orders[self._id] = removeId(table.orders[self._id], i)
+        table.columns[i][self._id] = None
+
+    def __contains__(self, name):
+        i = property_ids.get(name)
+        return i is not None and hasId(self._table.orders[self._id], i)
+
+    def __iter__(self):
+        for i in self._table.orders[self._id]:
+            yield property_names[i]
+
+    def __len__(self):
+        return len(self._table.orders[self._id])
+
+    def items(self):
+        columns = self._table.columns
+        pin_id = self._id
+        return [(property_names[i], columns[i][pin_id]) for i in self._table.orders[pin_id]]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class PinTable(MutableMapping):
+    # (pinname, index) => PinRecord, with integer pin ids underneath
+    # Like defaultdict(dict), looking up a missing pinref creates an empty record for it
+    def __init__(self):
+        # pin id => pinref, and => property ids in the order set; None once the pin has been deleted
+        self.pinrefs = []
+        self.orders = []
+        # property id => column of values indexed by pin id; columns only grow as far as their last value
+        self.columns = []
+        # pinref => pin id, in insertion order
+        self.ids = {}
+
+    def __add(self, pinref):
+        pin_id = len(self.pinrefs)
+        self.ids[pinref] = pin_id
+        self.pinrefs.append(pinref)
+        self.orders.append(b'')
+        return pin_id
+
+    def __getitem__(self, pinref):
+        pin_id = self.ids.get(pinref)
+        if pin_id is None:
+            pin_id = self.__add(pinref)
+        return PinRecord(self, pin_id)
+
+    def __setitem__(self, pinref, props):
+        pin_id = self.ids.get(pinref)
+        if pin_id is None:
+            pin_id = self.__add(pinref)
+        else:
+            self.__clear(pin_id)
+        record = PinRecord(self, pin_id)
+        for k, v in props.items():
+            record[k] = v
+
+    def __clear(self, pin_id):
+        for i in self.orders[pin_id]:
+            self.columns[i][pin_id] = None
+        self.orders[pin_id] = b''
+
+    def __delitem__(self, pinref):
+        pin_id = self.ids.pop(pinref)
+        self.__clear(pin_id)
+        self.pinrefs[pin_id] = None
+        self.orders[pin_id] = None
+
+    def __contains__(self, pinref):
+        return pinref in self.ids
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, pinref, default=None):
+        pin_id = self.ids.get(pinref)
+        if pin_id is None:
+            return default
+        return PinRecord(self, pin_id)
+
+    def pinId(self, pinref):
+        return self.ids[pinref]
+
+    def pinref(self, pin_id):
+        return self.pinrefs[pin_id]
+
+    def record(self, pin_id):
+        return PinRecord(self, pin_id)
+
+    def column(self, name):
+        # Values of one property for every pin id (None where unset); may be shorter than the pin count
+        i = property_ids.get(name)
+        if i is None or i >= len(self.columns):
+            return []
+        return self.columns[i]
+
+    def propertyNames(self):
+        # Names of the properties set on at least one pin, in property id order
+        ids = set()
+        for order in self.orders:
+            if order:
+                ids.update(order)
+        return [property_names[i] for i in sorted(ids)]
+
+    def toDicts(self):
+        # Plain {pinref: {propname: value}} copy, for pickling or serializing
+        return dict((pinref, dict(PinRecord(self, pin_id).items())) for pinref, pin_id in self.ids.items())
@@ -0,0 +1,176 @@
+# Pin assignment pre-solver for the generated FPGA components
+#
+# The Stanza pin solver searches over every supports option of a component, which for a big FPGA means
+# thousands of dio options.  Given the capabilities a design wants from the FPGA, this finds a feasible
+# assignment up front with Hopcroft-Karp bipartite matching, requests on one side and the pins and bundles
+# able to serve them on the other.  process_xdc.py writes the result out as a function declaring supported-by
+# statements; called in the pcb-module, they are pre-assigned to the Stanza solver, which then only searches
+# for the requests left over.
+#
+# Requests are read from a text file, one per line:
+#
+#     <ref> <capability> [family=<family>] [voltage=<volts>] [bank=<bank>] [count=<n>]
+#
+# e.g. "led dio family=LVCMOS voltage=3.3 count=4" asks for four LVCMOS 3.3V dio pins, led[0]..led[3], as
+# `require led:dio[4] from fpga` would.  Everything after a '#' is a comment.
+
+# Properties a request can constrain, with the conversion applied to the value given in the requests file
+constraint_types = {'family': str, 'voltage': float, 'bank': str}
+
+class CapabilityRequest(object):
+    # One capability wanted from the component, e.g. dio for led[2]
+    # constraints is a dict of property name => value every pin serving the request has to have
+    def __init__(self, ref, capability, constraints):
+        self.ref = ref
+        self.capability = capability
+        self.constraints = constraints
+
+    def key(self):
+        # Requests with the same key can be served by exactly the same resources
+        return (self.capability, tuple(sorted(self.constraints.items())))
+
+class SupportResource(object):
+    # A solo pin or a bundle: something which can serve one request, through any one of its capabilities
+    # name is what its option ids are built from, properties is property name => set of the values its pins have
+    def __init__(self, name, pinrefs, capabilities, properties):
+        self.name = name
+        self.pinrefs = pinrefs
+        self.capabilities = capabilities
+        self.properties = properties
+
+    def accepts(self, request):
+        if request.capability not in self.capabilities:
+            return False
+        for name, value in request.constraints.items():
+            if self.properties.get(name) != {value}:
+                return False
+        return True
+
+def readRequests(fname):
+    rval = []
+    f = open(fname)
+    for line_number, line in enumerate(f, 1):
+        fields = line.split('#', 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) < 2:
+            raise ValueError("%s:%u: expected <ref> <capability>"%(fname, line_number))
+        ref, capability = fields[0], fields[1]
+        constraints = {}
+        count = None
+        for field in fields[2:]:
+            name, sep, value = field.partition('=')
+            try:
+                if name == 'count' and sep:
+                    count = int(value)
+                elif name in constraint_types and sep:
+                    constraints[name] = constraint_types[name](value)
+                else:
+                    raise ValueError()
+            except ValueError:
+                raise ValueError("%s:%u: bad constraint %s"%(fname, line_number, field))
+        if count is None:
+            rval.append(CapabilityRequest(ref, capability, constraints))
+        else:
+            for i in range(count):
+                rval.append(CapabilityRequest('%s[%u]'%(ref, i), capability, constraints))
+    f.close()
+    return rval
+
+class PresolveSpec(object):
+    # What to pre-solve: the requests file, where the supported-by hints go and the name of the instance of
+    # the component the requests are made from
+    def __init__(self, requests_path, hints_path, instance='fpga'):
+        self.requests_path = requests_path
+        self.hints_path = hints_path
+        self.instance = instance
+        self.requests = readRequests(requests_path)
+
+def hopcroftKarp(adjacency, n_right):
+    # Maximum bipartite matching.  adjacency[u] lists the right vertices (0..n_right-1) left vertex u can take
+    # Returns the right vertex matched to each left vertex, None for the unmatched ones
+    n_left = len(adjacency)
+    match_left = [None] * n_left
+    match_right = [None] * n_right
+    # Start from a greedy matching.  Left vertices often share one adjacency list (every request for a
+    # LVCMOS 1.8V dio gets the same one), so each list keeps a cursor past its vertices already taken
+    cursors = {}
+    for u, edges in enumerate(adjacency):
+        i = cursors.get(id(edges), 0)
+        while i < len(edges) and match_right[edges[i]] is not None:
+            i += 1
+        if i < len(edges):
+            match_left[u] = edges[i]
+            match_right[edges[i]] = u
+        cursors[id(edges)] = i
+    while True:
+        # Layer the left vertices by alternating path length from the free ones
+        dist = [None] * n_left
+        queue = [u for u in range(n_left) if match_left[u] is None]
+        for u in queue:
+            dist[u] = 0
+        found = False
+        i = 0
+        while i < len(queue):
+            u = queue[i]
+            i += 1
+            for v in adjacency[u]:
+                w = match_right[v]
+                if w is None:
+                    found = True
+                elif dist[w] is None:
+                    dist[w] = dist[u] + 1
+                    queue.append(w)
+        if not found:
+            return match_left
+        # Augment along layered paths from every free vertex, with an explicit stack as paths can be long
+        # next_edge[u] is the edge of u being tried; a vertex found to lead nowhere is dropped from the layers
+        next_edge = [0] * n_left
+        for root in range(n_left):
+            if match_left[root] is not None:
+                continue
+            path = [root]
+            while path:
+                u = path[-1]
+                edges = adjacency[u]
+                while next_edge[u] < len(edges):
+                    v = edges[next_edge[u]]
+                    w = match_right[v]
+                    if w is None:
+                        for x in path:
+                            v = adjacency[x][next_edge[x]]
+                            match_left[x] = v
+                            match_right[v] = x
+                        path = []
+                        break
+                    if dist[w] is not None and dist[w] == dist[u] + 1:
+                        path.append(w)
+                        break
+                    next_edge[u] += 1
+                else:
+                    dist[u] = None
+                    path.pop()
+                    if path:
+                        next_edge[path[-1]] += 1
+
+def presolve(requests, resources):
+    # Match requests to resources, at most one request per resource
+    # Returns ([(request, resource)] in request order, [unmatched requests])
+    # Requests with the same capability and constraints share one candidate list, so building the graph
+    # takes one scan of the resources per distinct kind of request
+    candidates = {}
+    adjacency = []
+    for request in requests:
+        key = request.key()
+        if key not in candidates:
+            candidates[key] = [i for i, resource in enumerate(resources) if resource.accepts(request)]
+        adjacency.append(candidates[key])
+    match = hopcroftKarp(adjacency, len(resources))
+    assigned = []
+    unmatched = []
+    for request, v in zip(requests, match):
+        if v is None:
+            unmatched.append(request)
+        else:
+            assigned.append((request, resources[v]))
+    return assigned, unmatched
@@ -1,102 +1,171 @@
 #!/usr/bin/python3
-from collections import Iterable
 from collections import defaultdict
-from subprocess import check_output
+import bisect
+from multiprocessing import Pool
+import argparse
+import hashlib
+import importlib.util
+import io
+import json
 import os.path
 import csv
+import re
+import sys
+import time
+from atomicfile import atomicWrite
+from pinout import PackagePinout, isPowerNet, stanzifyName
+from presolve import PresolveSpec, SupportResource, presolve
+from pinstore import PinTable
+from profiling import NullProfiler, PhaseProfiler, profilePaths
+from writer import Writer
 
 """
 README: This script extracts a component definition with appropriate supports/pin/port statements
 based on xdc files exported from FPGA software.  It will look at al *.xdc files in the current directory,
 build a list of the properties assigned to them, unify them, and generate pcb-component
+
+Run as a script for the default xcku060 generation, or import it and drive the pipeline yourself:
+
+    db = PinDatabase()
+    parseXDCFiles(db, findXDCFiles('.'))
+    expandWildcards(db)
+    removeUnpackagedPins(db)
+    inferBundles(db)
+    convertIOSTANDARD(db)
+    pinout = PackagePinout('xcku060ffva1517pkg.csv')
+    indexBanks(db, pinout)
+    checkBankVoltages(db)
+    mergePackageCSV(db, pinout)
+    dumpPinAndPropertyDeclarations(db, 'xcku060-cmp.stanza')
+    dumpPinDatabase(db, pinout, 'pins.csv', 'pins.jsonl')
+
+or split the component into a package per I/O bank under xcku060-cmp/ with dumpShardedDeclarations.
+
+To hand the Stanza pin solver a ready made assignment, name the supports options and pre-solve a requests
+file (see presolve.py) into a package of supported-by statements, whose presolved-fpga() is then called in
+the pcb-module instantiating the component as fpga:
+
+    dumpPinAndPropertyDeclarations(db, 'xcku060-cmp.stanza', option_ids=True)
+    presolvePins(db, pinout, PresolveSpec('requests.txt', 'xcku060-cmp-presolved.stanza'))
+
+Nothing is read, written or printed at import time.
 """
 
-# Grab all .xdc files in the current directory
-s = check_output('ls')
-s = check_output('find . -name "*.xdc"',shell=True).decode("ASCII")
-fnames = [x.strip() for x in s.split()]
+class PinDatabase(object):
+    def __init__(self):
+        # Structure of this dictionary:
+        # Keys: (pinname:string, pinindex:int)
+        # Values: Dictionary:
+        #       Keys: propname:string
+        #       Values: props:one of (list, string, int, float)
+        # pinindex is None for non-vector pins
+        # get_ports glob patterns which haven't been expanded yet are kept as entries of their own, with the
+        # pattern as pinname and/or a string pinindex, e.g. ('ddr3-dq*', None), ('cb-ad', '*'), ('led', '?')
+        # Stored compactly in a PinTable, which gives every pin an integer id and interns names and values
+        self.props = PinTable()
+        # Inferred bundles: port type => (bundle name, index) => set of member pinrefs
+        self.bundles = {}
+        # Resolved bundle membership of every bundled pin: pinref => (port type, bundle key, accessor)
+        self.pin_bundles = {}
+        # Properties set to different values by different xdc files:
+        # (pinref, propname, earlier file, earlier value, winning file, winning value)
+        self.conflicts = []
+        # Banks the constrained pins sit in: bank => BankSummary, filled in by indexBanks
+        self.banks = {}
+        # Work done on this database so far: counter name => count (lines read, bundles inferred, ...)
+        self.counts = defaultdict(int)
 
-lines = []
+class ComponentSpec(object):
+    # Names used in the generated component package
+    def __init__(self, package, component, table, land_pattern, part):
+        self.package = package
+        self.component = component
+        self.table = table
+        self.land_pattern = land_pattern
+        self.part = part
 
-for fname in fnames:
-    f = open(fname)
-    lines.extend(f.readlines())
-    f.close()
+XCKU060 = ComponentSpec(package="xcku060-cmp",
+                        component="xilinx-XCKU060-1FFVA1517I-cmp",
+                        table="xcku-060-cmp-pins",
+                        land_pattern="BGA1517C100P39X39-4000X4000X351N",
+                        part="xilinx-XCKU060-1FFVA1517I-prt")
 
-lines = [l.strip() for l in lines]
-print("Read %u lines"%len(lines))
-# Remove empties
-lines = filter(lambda l:l,lines)
-# Remove comments
-lines = filter(lambda l:l[0] != '#', lines)
-lines = list(lines)
-print("After filtering comments and empties: %u lines"%len(lines))
-
-# Import csv file. Kinda hacky - maybe replace with dict?
-csv_name = "xcku060ffva1517pkg.csv"
-
-csv_lines = []
-f = open(csv_name)
-csv_lines.extend(f.readlines())
-f.close()
-csv_lines = [l.replace(" ", "").split(',') for l in csv_lines[1::]]
-pwr_names = list(set([l[1] for l in csv_lines if any(x in l[1] for x in ('GND', 'VCC', 'VTT'))]))
-pwr_pins = []
-for n in pwr_names:
-    pwr_pins.append([l[0] for l in csv_lines if l[1] == n])
-
-def vioRef(padName):
-    bank = 'VCCO_' + [l[3] for l in csv_lines if l[0] == padName][0]
-    pin = [l[0] for l in csv_lines if l[1] == bank][0]
-    return stanzifyName(bank)
-
-def smartSplit(s,end_char=None):
-    if isinstance(s,str):
-        s = [c for c in s]
-    pairs = {}
-    pairs['('] = ')'
-    pairs['['] = ']'
-    pairs['{'] = '}'
-    tokens = []
-    token = ''
-    while s:
-        c = s.pop(0)
-        if c in pairs:
-            if token:
-                tokens.append(token)
-                token = ''
-            tokens.append(smartSplit(s,pairs[c]))
-        elif c == end_char:
-            if token:
-                tokens.append(token)
-            end_char = None
-            break
-        else:
-            token += c
-    if end_char:
-        print("Unterminated group!")
-    rval = []
-    for t in tokens:
-        if isinstance(t,str):
-            rval.extend(t.split())
-        else:
-            rval.append(t)
+default_csv_name = "xcku060ffva1517pkg.csv"
+default_output_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "../xcku060-cmp.stanza")
+
+def scanFiles(root, suffix):
+    # path => (mtime in ns, size) of every file under root whose name ends with suffix
+    rval = {}
+    stack = [root]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.name.endswith(suffix):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                rval[entry.path] = (st.st_mtime_ns, st.st_size)
     return rval
 
-# Structure of this dictionary:
-# Keys: (pinname:string, pinindex:int)
-# Values: Dictionary:
-#       Keys: propname:string
-#       Values: props:one of (list, string, int, float)
-# pinindex is None for non-vector pins
+def findXDCFiles(root='.'):
+    # Grab all .xdc files under root, sorted so that the merge order doesn't depend on the filesystem
+    return sorted(scanFiles(root, '.xdc'))
+
+# Tokens of the Tcl subset Vivado emits: a quoted string, a group delimiter or a bare word.
+# Scanning with a single regex keeps tokenizing linear in the length of the command.
+group_close = {'(': ')', '[': ']', '{': '}'}
+token_re = re.compile(r'"((?:[^"\\]|\\.)*)"?|([()\[\]{}])|[^\s()\[\]{}"]+')
 
-props_ = defaultdict(lambda:{})
+def smartSplit(s):
+    # Split a command into whitespace separated tokens, nesting (), [] and {} groups as lists
+    # e.g. 'set_property IOSTANDARD LVDS [get_ports {CB_AD[7]}]'
+    #   => ['set_property', 'IOSTANDARD', 'LVDS', ['get_ports', ['CB_AD', ['7']]]]
+    tokens = []
+    stack = []
+    end_char = None
+    for m in token_re.finditer(s):
+        delim = m.group(2)
+        if delim is None:
+            quoted = m.group(1)
+            tokens.append(m.group(0) if quoted is None else quoted)
+        elif delim in group_close:
+            stack.append((tokens, end_char))
+            group = []
+            tokens.append(group)
+            tokens = group
+            end_char = group_close[delim]
+        elif delim == end_char:
+            tokens, end_char = stack.pop()
+        else:
+            # Stray closing delimiter, keep it as a word
+            tokens.append(delim)
+    if stack:
+        print("Unterminated group!")
+        tokens = stack[0][0]
+    return tokens
 
-def stanzifyName(s):
-    s = s.replace('_','-')
-    s = s.replace(' ', '-')
-    s = s.lower()
-    return s
+def readCommands(f):
+    # Yield the commands in an xdc file stream one at a time, joining backslash line continuations
+    # and skipping empty lines and comments (a continuation followed by a blank line is empty too)
+    command = ''
+    for l in f:
+        l = l.strip()
+        if l.endswith('\\'):
+            command += l[:-1] + ' '
+            continue
+        command = (command + l).strip()
+        if command and command[0] != '#':
+            yield command
+        command = ''
+    command = command.strip()
+    if command and command[0] != '#':
+        yield command
 
 def processPinName(l):
     # Expect a list of grouped tokens representing the strings like "get_ports {CB_AD[7]}"
@@ -114,8 +183,8 @@ def processPinName(l):
             # Vectored pin name
             name = l[1][0]
             index_token = l[1][1][0]
-            if index_token == '*':
-                # Wildcard will be applied to all indices when parsing finished
+            if isGlob(index_token):
+                # Wildcard will be applied to all matching indices when parsing finished
                 index = index_token
             else:
                 index = int(index_token)
@@ -125,100 +194,329 @@ def processPinName(l):
         print("Unhandled pin getter %s"%getter)
     return stanzifyName(name),index
 
-def handleSetProperty(s):
-    tokens = smartSplit(s)
-    assert(tokens.pop(0)=='set_property')
-    propname = tokens.pop(0)
-    propval = tokens.pop(0)
-    pinref = processPinName(tokens.pop(0))
+def setPinProperties(db, s, pinref, items):
+    # items is a list of (propname, propval) set on pinref by the command s
     if not pinref[0]:
         #Finish early, could not process the pinref
         print("Unhandled: %s" % s)
+        db.counts['unhandled-pinrefs'] += 1
         return
-    propdict = props_[pinref]
-    if propval == None:
-        raise Exception("None propval")
-    propdict[propname] = propval
+    propdict = db.props[pinref]
+    for propname, propval in items:
+        if propval == None:
+            raise Exception("None propval")
+        propdict[propname] = propval
+    db.counts['properties-set'] += len(items)
+
+def dictItems(tokens):
+    # -dict {PACKAGE_PIN AE7 IOSTANDARD LVCMOS18} (or the same as a quoted string) => [(propname, propval)]
+    # None if it isn't a list of name value pairs
+    if isinstance(tokens, str):
+        tokens = tokens.split()
+    tokens = [x[0] if isinstance(x, list) and len(x) == 1 else x for x in tokens]
+    if len(tokens) % 2 or not all(isinstance(x, str) for x in tokens):
+        return None
+    return list(zip(tokens[0::2], tokens[1::2]))
+
+def handleSetProperty(db, s, tokens):
+    assert(tokens[0]=='set_property')
+    if tokens[1] == '-dict':
+        items = dictItems(tokens[2])
+        if items is None:
+            print("Unhandled: %s" % s)
+            db.counts['unhandled-pinrefs'] += 1
+            return
+    else:
+        items = [(tokens[1], tokens[2])]
+    setPinProperties(db, s, processPinName(tokens[3]), items)
+
+# Fast path for the shapes nearly every exported line has, which skips smartSplit and the handler dispatch:
+#   set_property IOSTANDARD LVDS [get_ports {CB_AD[7]}]
+#   set_property -dict {PACKAGE_PIN AE7 IOSTANDARD LVCMOS18} [get_ports led_0]
+#   set_property -dict { PACKAGE_PIN E3 IOSTANDARD LVCMOS33 } [get_ports { led_2 }]
+# Anything else (quoting, nested groups, other commands) goes through the general tokenizer
+word_re = r'[^\s()\[\]{}"]+'
+set_property_re = re.compile((r'set_property\s+(?:-dict\s+\{([^{}\[\]()"]*)\}|(?!-)(%s)\s+(%s))'
+                              r'\s+\[get_ports\s+(?:\{\s*(%s)(?:\[([0-9*?]+)\])?\s*\}|(%s))\s*\]$') % ((word_re,) * 4))
+
+def handleFastSetProperty(db, s, m):
+    # Returns False if the line has to go through the general tokenizer after all
+    dict_body, propname, propval, name, index, bare_name = m.groups()
+    if dict_body is None:
+        items = [(propname, propval)]
+    else:
+        items = dictItems(dict_body)
+        if not items:
+            return False
+    if bare_name is not None:
+        name = bare_name
+    elif index is not None and not isGlob(index):
+        index = int(index)
+    setPinProperties(db, s, (stanzifyName(name), index), items)
+    return True
 
 line_handlers = {}
 line_handlers['set_property'] = handleSetProperty
 
-for l in lines:
-    tokens = l.split()
-    cmd = tokens[0]
-    if cmd in line_handlers:
-        line_handlers[cmd](l)
-    else:
-        print("Unhandled setter: %s"%l)
-
-# Apply wildcard parameters
-wildcards = set(filter(lambda x:x[1]=='*',props_))
-wildcards = set(x[0] for x in wildcards)
-for k in props_.keys():
-    if k[0] in wildcards:
-        props_[k].update(props_[(k[0],'*')])
-for wc in wildcards:
-    del props_[(wc,'*')]
-del wildcards
-
-# Check to see that all pins have a package assigned
-no_package = set()
-for k,v in props_.items():
-    if 'PACKAGE_PIN' not in v:
-        print("Pin %s has no package"%(str(k)))
-        no_package.add(k)
-for k in no_package:
-    del props_[k]
-del no_package
-
-# Just for debugging
-param_pools = defaultdict(set)
-for v in props_.values():
-    for k,v in v.items():
-        param_pools[k].add(v)
-print(param_pools)
-
-
-# Evaluating gaps in pin indices (just for debugging)
-index_dict = defaultdict(set)
-for name, index in props_.keys():
-    index_dict[name].add(index)
-for name, indices in index_dict.items():
-    if None in indices:
-        if len(indices)>1:
-            print("%s is both subscripted AND unsubscripted!"%name)
+def countLines(f, counts):
+    for l in f:
+        counts['lines-read'] += 1
+        yield l
+
+def parseXDC(db, f):
+    # Stream one xdc file through the tokenizer into db, returns the number of commands read
+    counts = db.counts
+    n_commands = 0
+    for l in readCommands(countLines(f, counts)):
+        n_commands += 1
+        m = set_property_re.match(l)
+        if m and handleFastSetProperty(db, l, m):
+            counts['lines-handled'] += 1
+            counts['fast-path'] += 1
+            continue
+        tokens = smartSplit(l)
+        cmd = tokens[0]
+        if isinstance(cmd, str) and cmd in line_handlers:
+            line_handlers[cmd](db, l, tokens)
+            counts['lines-handled'] += 1
+        else:
+            print("Unhandled setter: %s"%l)
+            counts['unhandled-setters'] += 1
+    counts['commands-read'] += n_commands
+    return n_commands
+
+# Bump whenever a change to the tokenizer or line handlers changes what a file parses to,
+# so stale entries in XDCCache are never used
+PARSER_VERSION = 2
+
+class XDCCache(object):
+    # On-disk cache of each xdc file's parsed (pinname, index) => properties contributions,
+    # keyed on the sha256 of the file contents and PARSER_VERSION
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def digest(self, f):
+        # Hashes the binary file f from where it is to the end, a chunk at a time
+        h = hashlib.sha256(b'%u\0' % PARSER_VERSION)
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+        return h.hexdigest()
+
+    def __path(self, digest):
+        return os.path.join(self.directory, digest + '.json')
+
+    def load(self, digest):
+        # Returns the cached props dictionary, or None on a miss
+        try:
+            f = open(self.__path(digest))
+            entries = json.load(f)
+            f.close()
+        except (OSError, ValueError):
+            return None
+        props = {}
+        for name, index, propdict in entries:
+            props[(name, index)] = propdict
+        return props
+
+    def store(self, digest, props):
+        entries = [[k[0], k[1], v] for k, v in props.items()]
+        with atomicWrite(self.__path(digest)) as f:
+            json.dump(entries, f)
+
+def parseXDCFile(fname, cache=None):
+    # Parse one xdc file on its own
+    # Returns (its (pinname, index) => properties contributions, whether they came from the cache,
+    # the parse counters; empty for a cache hit since nothing was parsed)
+    partial = PinDatabase()
+    if cache is None:
+        f = open(fname)
+        parseXDC(partial, f)
+        f.close()
+        return partial.props.toDicts(), False, dict(partial.counts)
+    # Hash the file as it streams past, and on a miss rewind and parse it from the same handle
+    f = open(fname, 'rb')
+    digest = cache.digest(f)
+    props = cache.load(digest)
+    if props is not None:
+        f.close()
+        return props, True, {}
+    f.seek(0)
+    text = io.TextIOWrapper(f, encoding='utf-8')
+    parseXDC(partial, text)
+    text.close()
+    props = partial.props.toDicts()
+    cache.store(digest, props)
+    return props, False, dict(partial.counts)
+
+def parseXDCJob(job):
+    # Pool worker for parseXDCFiles
+    fname, cache = job
+    return parseXDCFile(fname, cache)
+
+def mergeProps(db, props, fname, owners):
+    # Later files win on properties set in more than one file, just as if they had been parsed in sequence
+    # owners maps (pinref, propname) to the (file, value) that last set it, so that files disagreeing
+    # on a property can be reported
+    for pinref, propdict in props.items():
+        for propname, propval in propdict.items():
+            key = (pinref, propname)
+            if key in owners:
+                prev_fname, prev_val = owners[key]
+                if prev_fname != fname and prev_val != propval:
+                    print("Conflicting %s for %s: %s in %s, %s in %s, using %s"%(propname, str(pinref), prev_val, prev_fname, propval, fname, propval))
+                    db.conflicts.append((pinref, propname, prev_fname, prev_val, fname, propval))
+            owners[key] = (fname, propval)
+        db.props[pinref].update(propdict)
+
+def iterParsedXDCFiles(fnames, cache=None, jobs=1):
+    # Parse the files, in a pool of jobs worker processes if jobs isn't 1 (None for one per cpu),
+    # yielding (fname, props, from cache, counts) as parseXDCFile returns them, in the order given
+    jobs_list = [(fname, cache) for fname in fnames]
+    if jobs == 1 or len(fnames) < 2:
+        for fname, job in zip(fnames, jobs_list):
+            yield (fname,) + parseXDCJob(job)
+        return
+    pool = Pool(jobs)
+    try:
+        for fname, result in zip(fnames, pool.imap(parseXDCJob, jobs_list)):
+            yield (fname,) + result
+    finally:
+        pool.close()
+        pool.join()
+
+def parseXDCFiles(db, fnames, cache=None, jobs=1):
+    # Parse the files and merge them into db in the order given
+    owners = {}
+    n_cached = 0
+    for fname, props, cached, counts in iterParsedXDCFiles(fnames, cache, jobs):
+        n_cached += cached
+        for name, n in counts.items():
+            db.counts[name] += n
+        mergeProps(db, props, fname, owners)
+    db.counts['xdc-files'] += len(fnames)
+    db.counts['xdc-files-cached'] += n_cached
+    if cache is None:
+        print("Parsed %u files"%len(fnames))
     else:
-        for i in range(len(indices)):
-            if i not in indices:
-                print("%s is missing index %u!" % (name,i))
-del index_dict
+        print("Parsed %u files, %u from cache"%(len(fnames), n_cached))
 
-def groupPinsWithSuffixGroup(suffices):
-    rval = defaultdict(set)
-    for k, v in props_.items():
-        for suffix in suffices:
-            if k[0].endswith(suffix):
-                gname = k[0][:-len(suffix)]
-                rval[(gname, k[1])].add(k)
-                break
-    items = tuple(rval.items())
-    # Remove all elements which don't have one of each suffix
-    for k,v in items:
-        if len(v) != len(suffices):
-            print("Group %s length is %u, needed %u, removing"%(k,len(v),len(suffices)))
-            del rval[k]
-        elif not all(any(pinref[0].endswith(suf) for pinref in v) for suf in suffices):
-            print("Group %s has bad suffix set: "%name,v, ", removing")
-            del rval[k]
-    return rval
+def isGlob(s):
+    # Tcl glob special characters; [] never get here as they're split off as index groups by smartSplit
+    return isinstance(s, str) and ('*' in s or '?' in s)
+
+def isPattern(pinref):
+    return isGlob(pinref[0]) or isinstance(pinref[1], str)
+
+def portName(pinref):
+    # Name get_ports matches a pattern against, e.g. ('cb-ad', 7) => 'cb-ad[7]'
+    name, index = pinref
+    if index is None:
+        return name
+    return '%s[%s]'%(name, index)
+
+def globToRegex(pattern):
+    parts = []
+    for c in pattern:
+        if c == '*':
+            parts.append('.*')
+        elif c == '?':
+            parts.append('.')
+        else:
+            parts.append(re.escape(c))
+    return re.compile(''.join(parts), re.S)
+
+class PortPattern(object):
+    # A get_ports glob pattern compiled once, e.g. ('ddr3-dq*', None) or ('led', '?')
+    def __init__(self, pinref):
+        name, index = pinref
+        self.pinref = pinref
+        self.regex = globToRegex(portName(pinref))
+        # Everything up to the first glob character in the name, the key into PortIndex
+        self.prefix = re.split(r'[*?]', name, 1)[0]
+        self.literal_name = not isGlob(name)
+        # name[*] stands for every index of name and, as it always has, for the unsubscripted name as well
+        self.name_regex = globToRegex(name) if index == '*' else None
+        # Patterns are applied least specific first, so that a narrower pattern wins over a broader one
+        self.order = (len(re.sub(r'[*?]', '', portName(pinref))), portName(pinref))
+
+class PortIndex(object):
+    # Known ports by name, and their names sorted so the ports starting with a prefix are one bisect away
+    def __init__(self, pinrefs):
+        self.by_name = defaultdict(list)
+        for pinref in pinrefs:
+            self.by_name[pinref[0]].append(pinref)
+        self.names = sorted(self.by_name)
+
+    def candidates(self, pattern):
+        if pattern.literal_name:
+            return self.by_name.get(pattern.prefix, [])
+        rval = []
+        i = bisect.bisect_left(self.names, pattern.prefix)
+        while i < len(self.names) and self.names[i].startswith(pattern.prefix):
+            rval.extend(self.by_name[self.names[i]])
+            i += 1
+        return rval
+
+    def resolve(self, pattern):
+        # Known ports matching the pattern, in the order they were first seen
+        match = pattern.regex.fullmatch
+        name_match = pattern.name_regex.fullmatch if pattern.name_regex else None
+        return [pinref for pinref in self.candidates(pattern)
+                if match(portName(pinref)) or (name_match and pinref[1] is None and name_match(pinref[0]))]
 
-# Infer LVDS pairs from pin names
-# NOTE: Only one pin in an LVDS pair has to carry the LVDS IOSTANDARD, the other can be blank
-diffpair_suffix = ('-p', '-m')
-diffpair_pairs_ = groupPinsWithSuffixGroup(diffpair_suffix)
+def expandWildcards(db):
+    # Apply the properties set through get_ports glob patterns to every port they match
+    # As before, properties set through a pattern override those set on the matching ports directly
+    props_ = db.props
+    patterns = [PortPattern(k) for k in props_ if isPattern(k)]
+    if not patterns:
+        return
+    index = PortIndex(k for k in props_ if not isPattern(k))
+    patterns.sort(key=lambda pattern: pattern.order)
+    for pattern in patterns:
+        matches = index.resolve(pattern)
+        if not matches:
+            print("Pattern %s matches no ports"%portName(pattern.pinref))
+            db.counts['wildcards-unmatched'] += 1
+        pattern_props = dict(props_[pattern.pinref].items())
+        for k in matches:
+            props_[k].update(pattern_props)
+        db.counts['wildcards-expanded'] += len(matches)
+    for pattern in patterns:
+        del props_[pattern.pinref]
+    db.counts['wildcard-patterns'] += len(patterns)
+
+def removeUnpackagedPins(db):
+    # Check to see that all pins have a package assigned
+    no_package = set()
+    for k,v in db.props.items():
+        if 'PACKAGE_PIN' not in v:
+            print("Pin %s has no package"%(str(k)))
+            no_package.add(k)
+    for k in no_package:
+        del db.props[k]
+    db.counts['pins-unpackaged'] += len(no_package)
+
+def checkPinIndices(db):
+    # Evaluating gaps in pin indices (just for debugging)
+    index_dict = defaultdict(set)
+    for name, index in db.props.keys():
+        index_dict[name].add(index)
+    for name, indices in index_dict.items():
+        if None in indices:
+            if len(indices)>1:
+                print("%s is both subscripted AND unsubscripted!"%name)
+        else:
+            for i in range(len(indices)):
+                if i not in indices:
+                    print("%s is missing index %u!" % (name,i))
 
-items = tuple(diffpair_pairs_.items())
-for k,v in items:
+def checkDiffPair(db, k, v):
+    # Infer LVDS pairs from pin names
+    # NOTE: Only one pin in an LVDS pair has to carry the LVDS IOSTANDARD, the other can be blank
+    props_ = db.props
+    keep = True
     tag = "IOSTANDARD"
     iostandards = set(props_[pinref][tag] for pinref in filter(lambda x:tag in props_[x], v))
     if None in iostandards:
@@ -240,16 +538,16 @@ for k,v in items:
             pass
         else:
             print(k, " carries no IOSTANDARD , removing.")
-            del diffpair_pairs_[k]
+            keep = False
     elif len(iostandards) > 1:
         print(k, " carries multiple conflicting IOSTANDARDs : %s, removing." % (str(iostandards)))
-        del diffpair_pairs_[k]
+        keep = False
     elif next(iter(iostandards)) != "LVDS":
         print(k, " carries %s IOSTANDARD despite carrying LVDS naming, removing." % (next(iter(iostandards))))
-        del diffpair_pairs_[k]
+        keep = False
     elif len(v) != 2:
         print(k, " doesn't have 2 members (has %u), removing."%len(v))
-        del diffpair_pairs_[k]
+        keep = False
     # Make sure both pins have the IOstandard
     if len(iostandards) > 0:
         standard = next(iter(iostandards))
@@ -257,186 +555,427 @@ for k,v in items:
             raise("Bad")
         for pinref in v:
             props_[pinref]["IOSTANDARD"] = standard
-            print(props_[pinref]["PACKAGE_PIN"])
-del items
-print(diffpair_pairs_)
-
-# Infer UART pairs from pin names
-fullduplex_uart_suffix = ('-tx','-rx','-tx-en')
-fullduplex_uart_sets_ = groupPinsWithSuffixGroup(fullduplex_uart_suffix)
-
-rxonly_uart_suffix = ('-rx',)
-rxonly_uart_sets_ = groupPinsWithSuffixGroup(rxonly_uart_suffix)
-for k in fullduplex_uart_sets_:
-    if k in rxonly_uart_sets_:
-        del rxonly_uart_sets_[k]
-
-i2c_suffix = ('-scl','-sda')
-i2c_sets_ = groupPinsWithSuffixGroup(i2c_suffix)
-
-pinrefs_in_bundles_ = set()
-for val in diffpair_pairs_.values():
-    for pinref in val:
-        pinrefs_in_bundles_.add(pinref)
-for val in fullduplex_uart_sets_.values():
-    for pinref in val:
-        pinrefs_in_bundles_.add(pinref)
-for val in i2c_sets_.values():
-    for pinref in val:
-        pinrefs_in_bundles_.add(pinref)
-
-def pinrefEndsWith(pinref,suffices):
-    for end in suffices:
-        if pinref[0].endswith(end):
-            return end
+    return keep
+
+class BundleRule(object):
+    # How to recognise one kind of bundle from pin names
+    # members is a list of (pin name suffix, bundle accessor) or (pin name suffix, bundle accessor, width)
+    # e.g. pins "ddr3-clk-p" and "ddr3-clk-m" are the D_P and D_N members of diff-pair "ddr3-clk".
+    # The suffix can also be a tuple of alternatives, e.g. ('-m', '-n') for the D_N member.
+    # Scalar members of vectored pins bundle per index, so "lbdr-bus-p[1]" and "lbdr-bus-m[1]" make
+    # "lbdr-bus-1".  A member with a width is an array taking indices 0..width-1, e.g. "eth-txd[2]" is
+    # eth.txd[2]; the other members of such a bundle have to be unvectored.
+    # check(db, bundle key, member pinrefs) can veto a complete bundle
+    # The flattened accessors (e.g. txd[0]..txd[3]) and their offsets are worked out once here, so that
+    # inferBundles can fill a fixed size slot list per candidate bundle
+    def __init__(self, port_type, capability, members, check=None):
+        self.port_type = port_type
+        self.capability = capability
+        self.members = []
+        accessors = []
+        self.has_arrays = False
+        for member in members:
+            suffixes, accessor = member[0], member[1]
+            if isinstance(suffixes, str):
+                suffixes = (suffixes,)
+            width = member[2] if len(member) > 2 else None
+            self.members.append((suffixes, accessor, width))
+            if width is None:
+                accessors.append(accessor)
+            else:
+                self.has_arrays = True
+                for i in range(width):
+                    accessors.append('%s[%u]'%(accessor, i))
+        self.accessors = tuple(accessors)
+        self.offsets = dict((accessor, i) for i, accessor in enumerate(accessors))
+        self.check = check
+
+# Bundles inferred from pin names, in priority order: a pin only ever joins the first complete bundle that wants it
+# These follow the bundle classes in lib/interfaces.py (DiffPair, FullDuplexUARTWithEnable, i2c, SPI, jtag,
+# jtag_no_rst, rgmii), with member names in their stanza spelling
+bundle_rules = [
+    BundleRule('diff-pair', 'lvds', [('-p', 'D_P'), (('-m', '-n'), 'D_N')], checkDiffPair),
+    BundleRule('fullduplex-uart-w-enable', 'fullduplex-uart-w-enable', [('-tx', 'tx'), ('-rx', 'rx'), ('-tx-en', 'en')]),
+    BundleRule('i2c', 'i2c', [('-scl', 'scl'), ('-sda', 'sda')]),
+    BundleRule('spi', 'spi', [('-mosi', 'mosi'), ('-miso', 'miso'), ('-sck', 'sck'), ('-ss', 'ss')]),
+    BundleRule('jtag', 'jtag', [('-tck', 'tck'), ('-tdi', 'tdi'), ('-tdo', 'tdo'), ('-tms', 'tms'), ('-trstn', 'trstn')]),
+    BundleRule('jtag-no-rst', 'jtag-no-rst', [('-tck', 'tck'), ('-tdi', 'tdi'), ('-tdo', 'tdo'), ('-tms', 'tms')]),
+    BundleRule('rgmii', 'rgmii', [('-txd', 'txd', 4), ('-rxd', 'rxd', 4), ('-tx-clk', 'tx-clk'), ('-tx-ctrl', 'tx-ctrl'),
+                                  ('-rx-clk', 'rx-clk'), ('-rx-ctrl', 'rx-ctrl')]),
+]
+
+def suffixIndex(rules):
+    # suffix => [(rule number, width, offset of the member's (first) accessor)] for every rule with a member
+    # using that suffix
+    index = defaultdict(list)
+    for i, rule in enumerate(rules):
+        for suffixes, accessor, width in rule.members:
+            offset = rule.offsets[accessor if width is None else '%s[0]'%accessor]
+            for suffix in suffixes:
+                index[suffix].append((i, width, offset))
+    return index
+
+def longestSuffix(name, index):
+    # Every suffix starts with '-', so the longest one matching name starts at the leftmost '-' that gives a hit
+    pos = name.find('-', 1)
+    while pos > 0:
+        if name[pos:] in index:
+            return name[pos:]
+        pos = name.find('-', pos + 1)
     return None
 
-def dumpPropsToCSV():
-    f = open('out.csv', 'w+')
-    param_names = list(param_pools.keys())
-    param_names.sort()
-    f.write("PINNAME, INDEX, ")
-    for n in param_names:
-        f.write(n+', ')
-    f.write('\n"')
-    k = list(props_.keys())
-    k.sort()
-    for p in k:
-        f.write(p[0] + ', ')
-        if p[1] != None:
-            f.write(str(p[1]))
-        f.write(', ')
-        for n in param_names:
-            if n in props_[p] and props_[p][n] != None:
-                f.write(props_[p][n])
-            f.write(', ')
-        f.write('\n')
-    f.close()
-dumpPropsToCSV()
-del param_pools
+# lib/interfaces.py, loaded on first use as it lives outside this directory
+interfaces_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'interfaces.py')
+interfaces_module = None
+
+def loadInterfaces():
+    global interfaces_module
+    if interfaces_module is None:
+        module_spec = importlib.util.spec_from_file_location('interfaces', interfaces_path)
+        interfaces_module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(interfaces_module)
+    return interfaces_module
+
+def ruleSignature(rule):
+    # Structural signature of a rule's bundles in the form interfaces.signature() gives, e.g. ('D_N', 'D_P')
+    return tuple(sorted(accessor.replace('-', '_') for accessor in rule.accessors))
+
+def ruleCapabilities(rule, all_capabilities=False):
+    # Capabilities the bundles of rule are declared to support: the rule's own one, and with all_capabilities
+    # every capability in interfaces.CAPABILITY_TABLE with the same structure (one index lookup)
+    rval = [rule.capability]
+    if all_capabilities:
+        interfaces = loadInterfaces()
+        for name in interfaces.capabilities_for(ruleSignature(rule)):
+            name = interfaces.stanza_name(name)
+            if name not in rval:
+                rval.append(name)
+    return rval
+
+def inferBundles(db, rules=bundle_rules):
+    # Classify every pin by its longest known suffix in a single pass, filing it as a candidate member
+    # of each rule using that suffix, then accept complete candidates rule by rule
+    index = suffixIndex(rules)
+    # Per rule: bundle key (name, index) => member pinrefs by accessor offset, None for members not seen
+    candidates = [{} for rule in rules]
+    for pinref in db.props:
+        name, pin_index = pinref
+        suffix = longestSuffix(name, index)
+        if suffix is None:
+            continue
+        stem = name[:-len(suffix)]
+        for i, width, offset in index[suffix]:
+            if width is not None:
+                if not isinstance(pin_index, int) or not 0 <= pin_index < width:
+                    continue
+                key = (stem, None)
+                offset += pin_index
+            elif rules[i].has_arrays:
+                if pin_index is not None:
+                    continue
+                key = (stem, None)
+            else:
+                key = (stem, pin_index)
+            slots = candidates[i].get(key)
+            if slots is None:
+                slots = candidates[i][key] = [None] * len(rules[i].accessors)
+            slots[offset] = pinref
+
+    db.bundles = {}
+    db.pin_bundles = {}
+    incomplete = []
+    for rule, groups in zip(rules, candidates):
+        found = {}
+        for k, slots in groups.items():
+            v = set(pinref for pinref in slots if pinref is not None)
+            if len(v) != len(slots) or any(pinref in db.pin_bundles for pinref in v):
+                incomplete.append((rule, k, v))
+                continue
+            if rule.check and not rule.check(db, k, v):
+                db.counts['bundles-removed'] += 1
+                continue
+            found[k] = v
+            for accessor, pinref in zip(rule.accessors, slots):
+                db.pin_bundles[pinref] = (rule.port_type, k, accessor)
+        db.bundles[rule.port_type] = found
+        db.counts['bundles-inferred'] += len(found)
+    for rule, k, v in incomplete:
+        if not all(pinref in db.pin_bundles for pinref in v):
+            print("Group %s has %u of the %u %s pins, not bundling"%(k, len(v), len(rule.accessors), rule.port_type))
+            db.counts['bundles-incomplete'] += 1
 
 # FIXME TODO Handle PCIe lanes.  You need to actually get to work on the generators even though your parsing of the xbd files is incomplete
 
-def pinrefToName(k):
-    # If this is a diffpair we need to use D_P and D_N style names
-    suffix = None
-    if k in pinrefs_in_bundles_:
-        suffix = pinrefEndsWith(k, diffpair_suffix + fullduplex_uart_suffix + i2c_suffix)
-    if suffix:
-        prefix = k[0][:-len(suffix)]
-    else:
-        prefix = k[0]
-    rval = prefix
+def pinrefToName(db, k):
+    # Bundle members are named through their bundle, e.g. ('ddr3-clk-p', None) => ddr3-clk.D_P
+    if k in db.pin_bundles:
+        port_type, bundle_key, accessor = db.pin_bundles[k]
+        return pinrefToName(db, bundle_key) + '.' + accessor
+    rval = k[0]
     if k[1] != None:
         rval += '-' + str(k[1])
-    # Append appropriate bundle accessor
-    suffix_translate = {}
-    suffix_translate['-m'] = '.D_N'
-    suffix_translate['-p'] = '.D_P'
-    suffix_translate['-rx'] = '.rx'
-    suffix_translate['-tx'] = '.tx'
-    suffix_translate['-tx-en'] = '.en'
-    suffix_translate['-sda'] = '.sda'
-    suffix_translate['-scl'] = '.scl'
-    if suffix in suffix_translate:
-        rval += suffix_translate[suffix]
     return rval
 
 # Translate IOSTANDARDs to family and voltage
-def convertIOSTANDARD():
-    # IOSTANDARD name => (family, voltage)
-    lookup = {}
-    # CHECK ALL THESE VOLTAGES, NOT SURE
-    lookup['LVDS']           = ('LVDS',   1.5)
-    lookup['DIFF_SSTL15']    = ('SSTL',   1.5)
-    lookup['SERDES']         = ('SERDES', 1.8)
-    lookup['DIFF_HSTL_I_18'] = ('HSTL',   1.8)
-    lookup['LVCMOS18']       = ('LVCMOS', 1.8)
-    lookup['LVCMOS33']       = ('LVCMOS', 3.3)
-    lookup[None]             = ('LVCMOS', 1.8) #DEFAULT
-    for pinref, propset in props_.items():
+# IOSTANDARD name => (family, voltage)
+iostandard_lookup = {}
+# CHECK ALL THESE VOLTAGES, NOT SURE
+iostandard_lookup['LVDS']           = ('LVDS',   1.5)
+iostandard_lookup['DIFF_SSTL15']    = ('SSTL',   1.5)
+iostandard_lookup['SERDES']         = ('SERDES', 1.8)
+iostandard_lookup['DIFF_HSTL_I_18'] = ('HSTL',   1.8)
+iostandard_lookup['LVCMOS18']       = ('LVCMOS', 1.8)
+iostandard_lookup['LVCMOS33']       = ('LVCMOS', 3.3)
+iostandard_lookup[None]             = ('LVCMOS', 1.8) #DEFAULT
+
+def convertIOSTANDARD(db):
+    for pinref, propset in db.props.items():
         k = 'IOSTANDARD'
         if k in propset:
-            replacements = lookup[propset[k]]
+            replacements = iostandard_lookup[propset[k]]
             del propset[k]
         else:
-            replacements = lookup[None]
-            print("Pin %s had no IOSTANDARD set, using default %s"%(pinrefToName(pinref),str(replacements)))
+            replacements = iostandard_lookup[None]
+            print("Pin %s had no IOSTANDARD set, using default %s"%(pinrefToName(db, pinref),str(replacements)))
+            db.counts['iostandard-defaulted'] += 1
         propset['family'] = replacements[0]
         propset['voltage'] = replacements[1]
-convertIOSTANDARD()
-
-# Load the csv file, which has default values, which we will fill in for pins that aren't already populated
-# The only way we can correlate the csvs to the xdcs is through the pad name.
-# So build a set of the pads already occupied so we can know what lines to exclude
-def readCSV(fname):
-    f = open(fname)
-    lines = f.readlines()
-    f.close()
-    # Read Header
-    header_fields = [stanzifyName(x.strip()) for x in lines.pop(0).split(',')]
-    table = defaultdict(lambda: {})
-    for l in lines:
-        fields = [x.strip() for x in l.split(',')]
-        pad_name = fields[0]
-        #pin_name = fields[1]
-        for i in range(len(fields)):
-            if fields[i]:
-                table[pad_name][header_fields[i]] = fields[i]
-    return table
-csv_table = readCSV('xcku060ffva1517pkg.csv')
-
-# Build a map to the props keyed on the pad
-pad_map = {}
-for k,v in props_.items():
-    pad_map[v['PACKAGE_PIN']] = v
-
-for pad, vals in csv_table.items():
-    pin_name = stanzifyName(vals['pin-name'])
-    def translate(vals, lookup):
-        rval = {}
-        for k,v in vals.items():
-            if k in lookup:
-                k = lookup[k]
-                if k == None:
-                    continue
-            rval[k] = v
-        return rval
-    lookup = {}
-    lookup['pin'] = 'PACKAGE_PIN'
-    lookup['pin-name'] = None
-    vals = translate(vals, lookup)
-    if pad not in pad_map:
-        # Fresh entry
-        pinref = (pin_name,None)
-        if pinref not in props_:
-            props_[pinref] = vals.copy()
+
+def pinBank(db, pinout, pinref):
+    # I/O bank of a pin: its own bank property if the csv merge gave it one, else that of its pad in the
+    # package pinout.  None for pins outside any bank (power, config, unpackaged, ...).
+    props = db.props[pinref]
+    bank = props.get('bank')
+    if bank is None:
+        pad = props.get('PACKAGE_PIN')
+        if isinstance(pad, str) and pad in pinout:
+            bank = pinout.bank(pad)
+    if not isinstance(bank, str) or bank == 'NA':
+        return None
+    return bank
+
+# Families whose pins don't set the VCCO of their bank.  LVDS inputs run off VCCAUX whatever the bank's VCCO
+# is, so they can share a bank with anything
+vcco_agnostic_families = set(['LVDS'])
+
+class BankSummary(object):
+    # The constrained pins of one I/O bank and the VCCO they need
+    def __init__(self, bank, rail, pads):
+        self.bank = bank
+        # Stanza name of the bank's VCCO rail, e.g. vcco-44, and the number of pads in the bank
+        self.rail = rail
+        self.pads = pads
+        # voltage => pinrefs of the pins needing that VCCO, families => pin count
+        # Pins of vcco_agnostic_families are in families but not in voltages
+        self.voltages = defaultdict(list)
+        self.families = defaultdict(int)
+
+    def add(self, pinref, family, voltage):
+        self.families[family] += 1
+        if family not in vcco_agnostic_families:
+            self.voltages[voltage].append(pinref)
+
+    def pinCount(self):
+        return sum(self.families.values())
+
+    def vcco(self):
+        # The VCCO every pin in the bank needing one agrees on, None when there are none or they disagree
+        if len(self.voltages) == 1:
+            return next(iter(self.voltages))
+        return None
+
+    def isConflicted(self):
+        return len(self.voltages) > 1
+
+def indexBanks(db, pinout):
+    # Group the pins by the bank of their pad in the package pinout and collect the I/O voltages each bank
+    # is asked for, in one pass over the database.  Run after convertIOSTANDARD and before mergePackageCSV,
+    # so that only the pins constrained by the xdc files count.
+    # Only banks with VCCO_<bank> pads get a summary: GT/SERDES banks are powered some other way.
+    db.banks = {}
+    no_vcco = set()
+    for pinref, props in db.props.items():
+        bank = pinBank(db, pinout, pinref)
+        if bank is None:
+            db.counts['pins-bankless'] += 1
+            continue
+        summary = db.banks.get(bank)
+        if summary is None:
+            if bank in no_vcco or not pinout.vccoPads('VCCO_' + bank):
+                no_vcco.add(bank)
+                db.counts['pins-no-vcco'] += 1
+                continue
+            summary = db.banks[bank] = BankSummary(bank, stanzifyName('VCCO_' + bank), len(pinout.bankPads(bank)))
+        summary.add(pinref, props.get('family'), props.get('voltage'))
+    db.counts['banks'] = len(db.banks)
+
+def checkBankVoltages(db):
+    # All the I/O in a bank runs off its one VCCO rail, so pins wanting different voltages can't share a bank
+    # Returns the conflicted BankSummaries
+    rval = []
+    for bank in sorted(db.banks):
+        summary = db.banks[bank]
+        if summary.isConflicted():
+            uses = []
+            for voltage in sorted(summary.voltages, key=str):
+                pinrefs = sorted(summary.voltages[voltage], key=pinrefSortKey)
+                names = ', '.join(pinrefToName(db, pinref) for pinref in pinrefs[:3])
+                if len(pinrefs) > 3:
+                    names += ' and %u more'%(len(pinrefs) - 3)
+                uses.append('%sV (%s)'%(voltage, names))
+            print("Bank %s mixes %s on %s"%(bank, ' and '.join(uses), summary.rail))
+            rval.append(summary)
+    db.counts['bank-conflicts'] = len(rval)
+    return rval
+
+bank_table_columns = ['bank', 'vcco-rail', 'vcco', 'pins', 'pads', 'families', 'voltages']
+
+def dumpBankTable(db, path):
+    # Per-bank summary and VCCO rail assignment as csv, one row per bank with a VCCO holding constrained pins
+    # vcco is empty for conflicted banks, whose voltages column then lists every voltage asked for, and for
+    # banks holding only pins which don't need a particular VCCO
+    f = io.StringIO()
+    out = csv.writer(f, lineterminator='\n')
+    out.writerow(bank_table_columns)
+    for bank in sorted(db.banks):
+        summary = db.banks[bank]
+        vcco = summary.vcco()
+        out.writerow([bank, summary.rail, '' if vcco is None else vcco, summary.pinCount(), summary.pads,
+                      ' '.join('%s:%u'%item for item in sorted(summary.families.items(), key=str)),
+                      ' '.join('%s:%u'%(voltage, len(pinrefs))
+                               for voltage, pinrefs in sorted(summary.voltages.items(), key=str))])
+    if writeIfChanged(path, f.getvalue()):
+        print("Wrote %s"%path)
+    else:
+        print("%s is unchanged"%path)
+
+def translateCSVColumns(vals, lookup):
+    rval = {}
+    for k,v in vals.items():
+        if k in lookup:
+            k = lookup[k]
+            if k == None:
+                continue
+        rval[k] = v
+    return rval
+
+# csv column => property name, None to drop the column
+csv_column_lookup = {}
+csv_column_lookup['pin'] = 'PACKAGE_PIN'
+csv_column_lookup['pin-name'] = None
+
+def mergePackageCSV(db, pinout):
+    # Merge in the csv file, which has default values, which we will fill in for pins that aren't already populated
+    # The only way we can correlate the csvs to the xdcs is through the pad name.
+    # So build a set of the pads already occupied so we can know what lines to exclude
+    props_ = db.props
+    pad_map = {}
+    for k,v in props_.items():
+        pad_map[v['PACKAGE_PIN']] = v
+
+    counts = db.counts
+    for pad, vals in pinout.rows.items():
+        pin_name = stanzifyName(vals['pin-name'])
+        vals = translateCSVColumns(vals, csv_column_lookup)
+        counts['csv-rows-read'] += 1
+        if pad not in pad_map:
+            counts['csv-rows-merged'] += 1
+            # Fresh entry
+            pinref = (pin_name,None)
+            if pinref not in props_:
+                props_[pinref] = vals.copy()
+            else:
+                target_dict = props_[pinref]
+                for k,v in vals.items():
+                    if k in target_dict:
+                        if isinstance(target_dict[k],list):
+                            target_dict[k].append(v)
+                        else:
+                            new_val = [target_dict[k], v]
+                            target_dict[k] = new_val
+
+def pinrefSortKey(pinref):
+    # Sorts unsubscripted pins before the subscripted ones of the same name, which plain tuples can't
+    name, index = pinref
+    return (name, index is not None, index if index is not None else 0)
+
+# Properties exported as columns of their own rather than along with the rest
+export_columns = ['name', 'pin-name', 'index', 'pad', 'bank', 'bundle', 'bundle-type', 'accessor', 'family', 'voltage']
+exported_props = {'PACKAGE_PIN', 'bank', 'family', 'voltage'}
+
+def exportRecords(db, pinout):
+    # The merged pin database as one record per pin, sorted by pin: the export_columns plus a dict of every
+    # other property
+    for pinref in sorted(db.props, key=pinrefSortKey):
+        props = db.props[pinref]
+        bundle = bundle_type = accessor = None
+        if pinref in db.pin_bundles:
+            bundle_type, bundle_key, accessor = db.pin_bundles[pinref]
+            bundle = pinrefToName(db, bundle_key)
+        yield {'name': pinrefToName(db, pinref),
+               'pin-name': pinref[0],
+               'index': pinref[1],
+               'pad': props.get('PACKAGE_PIN'),
+               'bank': pinBank(db, pinout, pinref),
+               'bundle': bundle,
+               'bundle-type': bundle_type,
+               'accessor': accessor,
+               'family': props.get('family'),
+               'voltage': props.get('voltage'),
+               'properties': dict((k, v) for k, v in props.items() if k not in exported_props)}
+
+def csvField(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ' '.join(str(x) for x in value)
+    return value
+
+def dumpPinDatabase(db, pinout, csv_path=None, jsonl_path=None):
+    # Stream the merged pin database out row by row as csv and/or JSON lines, in one pass over the pins
+    # The csv has a column per property after the export_columns; each JSON line is one exportRecords record
+    # Each export is rendered in memory and then goes through writeIfChanged like the component, so an
+    # unchanged export keeps its mtime and an interrupted run never leaves half of one behind
+    outputs = []
+    writers = []
+    if csv_path:
+        f = io.StringIO(newline='')
+        outputs.append((csv_path, f))
+        writers.append(csvExportWriter(db, f))
+    if jsonl_path:
+        f = io.StringIO()
+        outputs.append((jsonl_path, f))
+        writers.append(jsonExportWriter(f))
+    if not outputs:
+        return
+    n = 0
+    for record in exportRecords(db, pinout):
+        for write in writers:
+            write(record)
+        n += 1
+    for path, f in outputs:
+        if writeIfChanged(path, f.getvalue()):
+            print("Wrote %s"%path)
         else:
-            target_dict = props_[pinref]
-            for k,v in vals.items():
-                if k in target_dict:
-                    if isinstance(target_dict[k],list):
-                        target_dict[k].append(v)
-                    else:
-                        new_val = [target_dict[k], v]
-                        target_dict[k] = new_val
-del pad_map
-
-class Writer(object):
-    def __init__(self,file):
-        self.file = file
-        self.__indent = 0
-    def __startLine(self):
-        self.file.write('  '*self.__indent)
-    def writeLine(self,*args):
-        self.__startLine()
-        for arg in args:
-            self.file.write(str(arg))
-        self.file.write('\n')
-    def indent(self):
-        self.__indent += 1
-    def unindent(self):
-        self.__indent -= 1
+            print("%s is unchanged"%path)
+    db.counts['pins-exported'] += n
+
+def csvExportWriter(db, f):
+    property_columns = [name for name in db.props.propertyNames() if name not in exported_props]
+    out = csv.writer(f, lineterminator='\n')
+    out.writerow(export_columns + property_columns)
+    def writeCSV(record):
+        properties = record['properties']
+        out.writerow([csvField(record[k]) for k in export_columns] +
+                     [csvField(properties.get(k)) for k in property_columns])
+    return writeCSV
+
+def jsonExportWriter(f):
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    def writeJSON(record):
+        f.write(encoder.encode(record))
+        f.write('\n')
+    return writeJSON
 
 def stringifyProp(prop):
     if isinstance(prop,list):
@@ -454,34 +993,28 @@ def stringifyProp(prop):
         propstring = '`'+prop
     return propstring
 
-def dumpPropertiesToTable(pinref, writer):
-    props_to_write = props_[pinref]
+def dumpPropertiesToTable(db, pinref, writer):
+    props_to_write = db.props[pinref]
     if len(props_to_write):
-        name = pinrefToName(pinref)
-        str = '[#R(' + name + '), '
-        for propname, propval in props_to_write.items():
+        name = pinrefToName(db, pinref)
+        row = ['[#R(', name, '), ']
+        items = props_to_write.items()
+        for propname, propval in items:
             if propname == 'PACKAGE_PIN':
-                pin = propval
-                str = str + stringifyProp(pin) + ', ['
-        for propname, propval in props_to_write.items():
+                row.append(stringifyProp(propval))
+                row.append(', [')
+        for propname, propval in items:
             if propname != 'PACKAGE_PIN':
-                str = str + '`' + propname + ' => ' + stringifyProp(propval) + ' '
-        str = str + ']]'
-        writer.writeLine(str)
-
-def flatten(l):
-    for el in l:
-        if isinstance(el, Iterable) and not isinstance(el, (str, bytes)):
-            yield from flatten(el)
-        else:
-            yield el
-
-def dumpPinAndPropertyDeclarations():
-    my_path = os.path.abspath(os.path.dirname(__file__))
-    path = os.path.join(my_path, "../xcku060-cmp.stanza")
-    f = open(path, 'w+')
-    writer = Writer(f)
-    writer.writeLine("defpackage xcku060-cmp :")
+                row.append('`%s => %s '%(propname, stringifyProp(propval)))
+        row.append(']]')
+        writer.writeLine(''.join(row))
+
+def optionId(name, capability):
+    # Id of the supports option through which the solo pin or bundle called name supports capability
+    return '%s-%s'%(name, capability)
+
+def writePackageHeader(writer, package, imports=()):
+    writer.writeLine("defpackage %s :"%package)
     writer.indent()
     writer.writeLine("import core")
     writer.writeLine("import collections")
@@ -493,103 +1026,622 @@ def dumpPinAndPropertyDeclarations():
     writer.writeLine("import rtm/ir-gen")
     writer.writeLine("import rtm/ir-connections")
     writer.writeLine("import rtm/ir-utils")
+    for name in imports:
+        writer.writeLine("import %s"%name)
     writer.unindent()
     writer.writeLine("#use-added-syntax(ir-gen)")
 
-    writer.writeLine("pcb-component xilinx-XCKU060-1FFVA1517I-cmp :")
-    writer.indent()
-    # Write table
-    # First go through writing the diff pairs
-
-    def declareBundleTable(bundle_dict, bundle_str):
-        bundle_names = list(bundle_dict.keys())
-        bundle_names.sort()
-        for name in bundle_names:
-            for pinref in bundle_dict[name]:
-                dumpPropertiesToTable(pinref, writer)
-    def declareBundles(bundle_dict, bundle_str):
-        bundle_names = list(bundle_dict.keys())
-        bundle_names.sort()
-        for name in bundle_names:
-            writer.writeLine("port ", pinrefToName(name), " : %s"%bundle_str)
+def ruleBundles(db, keep=None):
+    # [(rule, bundle key => member pinrefs)] in rule order, only the bundles keep(rule, key) accepts if given
+    rval = []
+    for rule in bundle_rules:
+        bundles = db.bundles.get(rule.port_type, {})
+        if keep is not None:
+            bundles = dict((k, v) for k, v in bundles.items() if keep(rule, k))
+        rval.append((rule, bundles))
+    return rval
+
+def writeDeclarations(db, writer, rule_bundles, solo_pinrefs, all_capabilities=False, option_ids=False):
+    # The port, pin and supports statements of the given bundles and solo pins
+    def supportsLine(capability, name):
+        # With option_ids every option gets an explicit id, so that supported-by statements can name it
+        if option_ids:
+            return "supports %s (%s):"%(capability, optionId(name, capability))
+        return "supports %s:"%capability
 
     # Declare bundles
-    declareBundles(diffpair_pairs_, 'diff-pair')
-    declareBundles(fullduplex_uart_sets_, 'fullduplex-uart-w-enable')
-    declareBundles(i2c_sets_, 'i2c')
+    for rule, bundles in rule_bundles:
+        for name in sorted(bundles, key=pinrefSortKey):
+            writer.writeLine("port ", pinrefToName(db, name), " : %s"%rule.port_type)
 
     # Declare the individual pins
-    solo_pinrefs = list(props_.keys())
-    for pinref in pinrefs_in_bundles_:
-        solo_pinrefs.remove(pinref)
-    solo_pinrefs.sort()
     for pinref in solo_pinrefs:
-        writer.writeLine("pin ", pinrefToName(pinref))
+        writer.writeLine("pin ", pinrefToName(db, pinref))
 
     # Declare all "supports" statements
     for pinref in solo_pinrefs:
-        writer.writeLine("supports dio:")
+        writer.writeLine(supportsLine("dio", pinrefToName(db, pinref)))
         writer.indent()
-        writer.writeLine("dio => ", pinrefToName(pinref))
+        writer.writeLine("dio => ", pinrefToName(db, pinref))
         writer.unindent()
     # TODO: DDR3, pci-lane, serdes-par pair
-    for pairs in diffpair_pairs_.values():
-        writer.writeLine("supports lvds:")
-        writer.indent()
-        suffices = {}
-        suffices['-p'] = '.D_P'
-        suffices['-m'] = '.D_N'
-        for pinref in pairs:
-            writer.writeLine(pinrefToName(('lvds' + suffices[pinrefEndsWith(pinref,diffpair_suffix)],None)), ' => ',pinrefToName(pinref))
-        writer.unindent()
-    for sets in fullduplex_uart_sets_.values():
-        writer.writeLine("supports fullduplex-uart-w-enable:")
-        writer.indent()
-        suffices = {}
-        suffices['-rx'] = '.rx'
-        suffices['-tx'] = '.tx'
-        suffices['-tx-en'] = '.en'
-        for pinref in sets:
-            writer.writeLine(pinrefToName(('fullduplex-uart-w-enable' + suffices[pinrefEndsWith(pinref,fullduplex_uart_suffix)],None)), ' => ',pinrefToName(pinref))
-        writer.unindent()
-    for sets in i2c_sets_.values():
-        writer.writeLine("supports i2c:")
-        writer.indent()
-        suffices = {}
-        suffices['-sda'] = '.sda'
-        suffices['-scl'] = '.scl'
-        for pinref in sets:
-            writer.writeLine(pinrefToName(('i2c' + suffices[pinrefEndsWith(pinref,i2c_suffix)],None)), ' => ',pinrefToName(pinref))
-        writer.unindent()
+    for rule, bundles in rule_bundles:
+        capabilities = ruleCapabilities(rule, all_capabilities)
+        for key, members in bundles.items():
+            for capability in capabilities:
+                writer.writeLine(supportsLine(capability, pinrefToName(db, key)))
+                writer.indent()
+                for pinref in sorted(members, key=pinrefSortKey):
+                    writer.writeLine(capability, '.', db.pin_bundles[pinref][2], ' => ', pinrefToName(db, pinref))
+                writer.unindent()
 
-    writer.writeLine("val xcku-060-cmp-pins = [")
+def writePinTable(db, writer, table, rule_bundles, solo_pinrefs, public=False):
+    # [ref, pad, properties] of every pin, bundle members first
+    writer.writeLine("%sval %s = ["%("public " if public else "", table))
     writer.indent()
-    declareBundleTable(diffpair_pairs_, 'diff-pair')
-    declareBundleTable(fullduplex_uart_sets_, 'fullduplex-uart-w-enable')
-    declareBundleTable(i2c_sets_, 'i2c')
+    for rule, bundles in rule_bundles:
+        for name in sorted(bundles, key=pinrefSortKey):
+            for pinref in sorted(bundles[name], key=pinrefSortKey):
+                dumpPropertiesToTable(db, pinref, writer)
     for pinref in solo_pinrefs:
-        dumpPropertiesToTable(pinref, writer)
-    #for i in range(len(pwr_names)):
-    #    str = '[#R(' + stanzifyName(pwr_names[i]) + '), ['
-    #    for p in pwr_pins[i][:]:
-    #        str = str + '`' + p + ', '
-    #    str = str[0:-2] + '], []]'
-    #    writer.writeLine(str)
+        dumpPropertiesToTable(db, pinref, writer)
     writer.unindent()
     writer.writeLine("]")
 
-    writer.writeLine("for [ref, lnd, props] in xcku-060-cmp-pins do :")
+def writeTableProperties(writer, table):
+    writer.writeLine("for [ref, lnd, props] in %s do :"%table)
     writer.writeLine("  properties(ref) :")
     writer.writeLine("    PACKAGE_PIN => lnd")
     writer.writeLine("    for p in props do :")
     writer.writeLine("      {Ref(key(p))} => value(p)")
+
+def writeComponentPackage(writer, spec):
+    writer.writeLine("val ps = PinSpec(to-tuple(left-mapping), false)")
+    writer.writeLine("package = %s(cmp-pad-map(ps))"%spec.land_pattern)
+    writer.writeLine("part = %s"%spec.part)
+
+def writePinAndPropertyDeclarations(db, writer, spec=XCKU060, all_capabilities=False, option_ids=False):
+    writePackageHeader(writer, spec.package)
+
+    writer.writeLine("pcb-component %s :"%spec.component)
+    writer.indent()
+    # Write table
+    # First go through writing the bundles, in rule order
+    rule_bundles = ruleBundles(db)
+    solo_pinrefs = [pinref for pinref in db.props if pinref not in db.pin_bundles]
+    solo_pinrefs.sort(key=pinrefSortKey)
+    writeDeclarations(db, writer, rule_bundles, solo_pinrefs, all_capabilities, option_ids)
+    writePinTable(db, writer, spec.table, rule_bundles, solo_pinrefs)
+    writeTableProperties(writer, spec.table)
     writer.writeLine("val left-mapping = Vector<KeyValue<Ref, ?>>()")
-    writer.writeLine("for [ref, lnd, _] in xcku-060-cmp-pins do :")
+    writer.writeLine("for [ref, lnd, _] in %s do :"%spec.table)
     writer.writeLine("  add(left-mapping, ref => lnd)")
-    writer.writeLine("val ps = PinSpec(to-tuple(left-mapping), false)")
-    writer.writeLine("package = BGA1517C100P39X39-4000X4000X351N(cmp-pad-map(ps))")
-    writer.writeLine("part = xilinx-XCKU060-1FFVA1517I-prt")
+    writeComponentPackage(writer, spec)
+
+def renderPinAndPropertyDeclarations(db, spec=XCKU060, all_capabilities=False, option_ids=False):
+    writer = Writer()
+    writePinAndPropertyDeclarations(db, writer, spec, all_capabilities, option_ids)
+    db.counts['statements-emitted'] = len(writer.lines)
+    return writer.getvalue()
 
+def fileDigest(path):
+    # sha256 of a file's contents, None if it doesn't exist
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1 << 16), b''):
+        h.update(chunk)
     f.close()
-dumpPinAndPropertyDeclarations()
+    return h.hexdigest()
+
+def writeIfChanged(path, text):
+    # Atomically replace path with text unless it already holds exactly that, returns whether it was written
+    # Leaving an unchanged file alone keeps its mtime, so nothing downstream of it gets rebuilt
+    data = text.encode()
+    if fileDigest(path) == hashlib.sha256(data).hexdigest():
+        return False
+    with atomicWrite(path, 'wb') as f:
+        f.write(data)
+    return True
+
+def dumpPinAndPropertyDeclarations(db, path=default_output_path, spec=XCKU060, all_capabilities=False,
+                                   option_ids=False):
+    if writeIfChanged(path, renderPinAndPropertyDeclarations(db, spec, all_capabilities, option_ids)):
+        print("Wrote %s"%path)
+    else:
+        print("%s is unchanged"%path)
+
+def shardPins(db, pinout):
+    # Split the component up by I/O bank: shard name => (ruleBundles, solo pinrefs), e.g. 'bank-44'
+    # Pins outside any bank go in 'other', a bundle goes with the bank of its first member
+    pin_shards = {}
+    for pinref in db.props:
+        bank = pinBank(db, pinout, pinref)
+        pin_shards[pinref] = 'other' if bank is None else stanzifyName('bank-' + bank)
+    bundle_shards = {}
+    for port_type, bundles in db.bundles.items():
+        for key, members in bundles.items():
+            bundle_shards[(port_type, key)] = pin_shards[min(members, key=pinrefSortKey)]
+    solo_pinrefs = defaultdict(list)
+    for pinref in sorted(db.props, key=pinrefSortKey):
+        if pinref not in db.pin_bundles:
+            solo_pinrefs[pin_shards[pinref]].append(pinref)
+    rval = {}
+    for shard in sorted(set(pin_shards.values())):
+        keep = lambda rule, key, shard=shard: bundle_shards[(rule.port_type, key)] == shard
+        rval[shard] = (ruleBundles(db, keep), solo_pinrefs[shard])
+    return rval
+
+def renderShardedDeclarations(db, pinout, spec=XCKU060, all_capabilities=False, option_ids=False):
+    # The component as a package per shard plus a top-level package composing them
+    # Each shard package holds its pins' table and a function declaring their ports, pins, supports and
+    # properties inside the component calling it
+    # Returns (top-level package text, shard name => shard package text)
+    shard_texts = {}
+    calls = []
+    tables = []
+    packages = []
+    for shard, (rule_bundles, solo_pinrefs) in shardPins(db, pinout).items():
+        package = '%s/%s'%(spec.package, shard)
+        function = '%s-%s'%(spec.package, shard)
+        table = '%s-%s'%(spec.table, shard)
+        writer = Writer()
+        writePackageHeader(writer, package)
+        writePinTable(db, writer, table, rule_bundles, solo_pinrefs, public=True)
+        writer.writeLine("public defn %s () :"%function)
+        writer.indent()
+        writer.writeLine("inside pcb-component :")
+        writer.indent()
+        writeDeclarations(db, writer, rule_bundles, solo_pinrefs, all_capabilities, option_ids)
+        writeTableProperties(writer, table)
+        shard_texts[shard] = writer.getvalue()
+        db.counts['statements-emitted'] += len(writer.lines)
+        packages.append(package)
+        calls.append(function)
+        tables.append(table)
+
+    writer = Writer()
+    writePackageHeader(writer, spec.package, packages)
+    writer.writeLine("pcb-component %s :"%spec.component)
+    writer.indent()
+    for function in calls:
+        writer.writeLine("%s()"%function)
+    writer.writeLine("val left-mapping = Vector<KeyValue<Ref, ?>>()")
+    writer.writeLine("for table in [%s] do :"%' '.join(tables))
+    writer.writeLine("  for [ref, lnd, _] in table do :")
+    writer.writeLine("    add(left-mapping, ref => lnd)")
+    writeComponentPackage(writer, spec)
+    db.counts['statements-emitted'] += len(writer.lines)
+    db.counts['shards'] = len(shard_texts)
+    return writer.getvalue(), shard_texts
+
+# File names shardPins gives the shards: bank-<bank>.stanza and other.stanza
+shard_fname_re = re.compile(r'(bank-[^./]+|other)\.stanza$')
+
+def shardDirectory(path):
+    # Shards of the component generated at lib/xcku060-cmp.stanza go in lib/xcku060-cmp/
+    directory = os.path.splitext(path)[0]
+    if directory == path:
+        raise ValueError("%s has no extension, so there is no shard directory name to derive from it"%path)
+    return directory
+
+def shardPaths(path):
+    # The shard files currently in the shard directory of the component generated at path
+    # Other files in the directory aren't the generator's, so they are left out
+    directory = shardDirectory(path)
+    try:
+        fnames = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, fname) for fname in sorted(fnames) if shard_fname_re.match(fname)]
+
+def dumpShardedDeclarations(db, pinout, path=default_output_path, spec=XCKU060, all_capabilities=False,
+                            option_ids=False):
+    # Write the shards, dropping those of banks no longer used (files not named like a shard are left alone),
+    # then the top-level package importing them.
+    # Only changed files are rewritten, so an edit to one bank only recompiles that bank's package and the
+    # small top-level one.  The shard files have to be handed to the compiler along with the top-level file.
+    text, shard_texts = renderShardedDeclarations(db, pinout, spec, all_capabilities, option_ids)
+    directory = shardDirectory(path)
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    for shard, shard_text in shard_texts.items():
+        if writeIfChanged(os.path.join(directory, shard + '.stanza'), shard_text):
+            written += 1
+    for shard_path in shardPaths(path):
+        if os.path.basename(shard_path)[:-len('.stanza')] not in shard_texts:
+            os.remove(shard_path)
+            print("Removed %s"%shard_path)
+    db.counts['shards-written'] += written
+    print("Wrote %u of the %u shards in %s"%(written, len(shard_texts), directory))
+    if writeIfChanged(path, text):
+        print("Wrote %s"%path)
+    else:
+        print("%s is unchanged"%path)
+
+def resourceProperties(db, pinout, pinrefs):
+    # family, voltage and bank => the set of values the given pins have
+    rval = defaultdict(set)
+    for pinref in pinrefs:
+        props = db.props[pinref]
+        bank = pinBank(db, pinout, pinref)
+        for name, value in (('family', props.get('family')), ('voltage', props.get('voltage')), ('bank', bank)):
+            if value is not None and not isinstance(value, list):
+                rval[name].add(value)
+    return rval
+
+def supportResources(db, pinout, all_capabilities=False):
+    # Everything the component's supports options offer, as presolve.SupportResources: each inferred bundle
+    # with the capabilities of its rule, then each solo pin with dio.  Power pins are left out.
+    rval = []
+    for rule in bundle_rules:
+        capabilities = ruleCapabilities(rule, all_capabilities)
+        bundles = db.bundles.get(rule.port_type, {})
+        for key in sorted(bundles, key=pinrefSortKey):
+            pinrefs = sorted(bundles[key], key=pinrefSortKey)
+            rval.append(SupportResource(pinrefToName(db, key), pinrefs, capabilities,
+                                        resourceProperties(db, pinout, pinrefs)))
+    for pinref in sorted((pinref for pinref in db.props if pinref not in db.pin_bundles), key=pinrefSortKey):
+        pad = db.props[pinref].get('PACKAGE_PIN')
+        if not isinstance(pad, str) or (pad in pinout and isPowerNet(pinout.pinName(pad))):
+            continue
+        rval.append(SupportResource(pinrefToName(db, pinref), [pinref], ['dio'],
+                                    resourceProperties(db, pinout, [pinref])))
+    return rval
+
+def writeSupportedByHints(assigned, presolve_spec, writer, spec=XCKU060):
+    # A package named after the hints file with one function, presolved-<instance>, declaring the assignment
+    # as supported-by statements.  Called in the pcb-module instantiating the component, its statements are
+    # taken by the pin solver as a pre-assigned part of the solution.
+    package = os.path.splitext(os.path.basename(presolve_spec.hints_path))[0]
+    writer.writeLine("; Pin assignment pre-solved by process_xdc.py for the requests in %s"%presolve_spec.requests_path)
+    writePackageHeader(writer, package)
+    writer.writeLine("; Call in the pcb-module which instantiates %s as %s"%(spec.component, presolve_spec.instance))
+    writer.writeLine("public defn presolved-%s () :"%presolve_spec.instance)
+    writer.indent()
+    writer.writeLine("inside pcb-module :")
+    writer.indent()
+    for request, resource in assigned:
+        writer.writeLine("required port %s.%s supported-by %s.%s"%(presolve_spec.instance, request.ref,
+                                                                   presolve_spec.instance,
+                                                                   optionId(resource.name, request.capability)))
+    if not assigned:
+        writer.writeLine("false")
+
+def presolvePins(db, pinout, presolve_spec, spec=XCKU060, all_capabilities=False):
+    # Match the requests of presolve_spec to the component's pins and bundles and write the assignment out as
+    # supported-by statements naming the options of a component generated with option_ids
+    # Returns the requests which couldn't be served
+    assigned, unmatched = presolve(presolve_spec.requests, supportResources(db, pinout, all_capabilities))
+    for request in unmatched:
+        constraints = ''.join(' %s=%s'%item for item in sorted(request.constraints.items()))
+        print("No pin or bundle left for %s %s%s"%(request.ref, request.capability, constraints))
+    db.counts['presolve-requests'] += len(presolve_spec.requests)
+    db.counts['presolve-unmatched'] += len(unmatched)
+    writer = Writer()
+    writeSupportedByHints(assigned, presolve_spec, writer, spec)
+    if writeIfChanged(presolve_spec.hints_path, writer.getvalue()):
+        print("Wrote %s"%presolve_spec.hints_path)
+    else:
+        print("%s is unchanged"%presolve_spec.hints_path)
+    return unmatched
+
+# The generator's own sources are part of the manifest so that editing them also forces a regeneration
+generator_sources = tuple(os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                          for name in ('process_xdc.py', 'atomicfile.py', 'pinout.py', 'pinstore.py', 'presolve.py',
+                                       'profiling.py', 'writer.py', '../interfaces.py'))
+
+def inputManifest(fnames, csv_path, spec=XCKU060, all_capabilities=False, presolve_spec=None, sharded=False):
+    # Hashes of everything a generation depends on
+    inputs = {}
+    paths = list(fnames) + [csv_path]
+    if presolve_spec:
+        paths.append(presolve_spec.requests_path)
+    for path in paths:
+        inputs[path] = fileDigest(path)
+    generator = {}
+    for path in generator_sources:
+        generator[os.path.basename(path)] = fileDigest(path)
+    return {'parser-version': PARSER_VERSION,
+            'component': spec.component,
+            'all-capabilities': all_capabilities,
+            'sharded': sharded,
+            'presolve': presolve_spec and {'hints': presolve_spec.hints_path, 'instance': presolve_spec.instance},
+            'generator': generator,
+            'inputs': inputs}
+
+def manifestPath(output_path):
+    return output_path + '.manifest.json'
+
+def readManifest(path):
+    try:
+        f = open(path)
+        manifest = json.load(f)
+        f.close()
+    except (OSError, ValueError):
+        return None
+    return manifest
+
+def outputPaths(output_path, csv_path=None, jsonl_path=None, presolve_spec=None, bank_table=None, sharded=False):
+    # Every file a generation with these options writes.  The shards are whichever files are in the shard
+    # directory: one deleted since the last run is missing from the list and one added is extra, so either
+    # way the list no longer matches the manifest.
+    paths = [output_path]
+    for path in (csv_path, jsonl_path, presolve_spec and presolve_spec.hints_path, bank_table):
+        if path:
+            paths.append(path)
+    if sharded:
+        paths.extend(shardPaths(output_path))
+    return paths
+
+def outputDigests(output_paths):
+    return dict((path, fileDigest(path)) for path in output_paths)
+
+def writeManifest(path, manifest, output_paths):
+    manifest = dict(manifest)
+    manifest['output'] = outputDigests(output_paths)
+    writeIfChanged(path, json.dumps(manifest, indent=2, sort_keys=True) + '\n')
+
+def isUpToDate(manifest_path, manifest, output_paths):
+    # True when the last generation used exactly these inputs and wrote every one of output_paths, none of
+    # which has been touched since.  A missing output has a None digest, so it never matches.
+    previous = readManifest(manifest_path)
+    if previous is None:
+        return False
+    if previous.get('output') != outputDigests(output_paths):
+        return False
+    del previous['output']
+    return previous == manifest
+
+def generate(fnames, pinout, output_path=default_output_path, csv_path=None, spec=XCKU060, cache=None, jobs=1,
+             profiler=None, all_capabilities=False, presolve_spec=None, bank_table=None, jsonl_path=None,
+             sharded=False):
+    # Run the whole pipeline over the given xdc files and package pinout, timing each phase with profiler if given
+    # Returns the finished pin database
+    if profiler is None:
+        profiler = NullProfiler()
+    db = PinDatabase()
+    with profiler.phase('tokenize'):
+        parseXDCFiles(db, fnames, cache, jobs)
+    return processPins(db, pinout, output_path, csv_path, spec, profiler, all_capabilities, presolve_spec,
+                       bank_table, jsonl_path, sharded)
+
+def processPins(db, pinout, output_path=default_output_path, csv_path=None, spec=XCKU060, profiler=None,
+                all_capabilities=False, presolve_spec=None, bank_table=None, jsonl_path=None, sharded=False):
+    # Everything after parsing: take a database holding the merged xdc properties through to the output file,
+    # and with a presolve_spec on to the supported-by hints.  Bank voltage conflicts are always reported, the
+    # per-bank VCCO table is written to bank_table if given.  The merged pin database is exported to
+    # csv_path and/or jsonl_path if given.  With sharded the component is split into a package per bank.
+    if profiler is None:
+        profiler = NullProfiler()
+    with profiler.phase('wildcards'):
+        expandWildcards(db)
+    with profiler.phase('filter'):
+        removeUnpackagedPins(db)
+        checkPinIndices(db)
+    with profiler.phase('bundles'):
+        inferBundles(db)
+    with profiler.phase('iostandard'):
+        convertIOSTANDARD(db)
+    with profiler.phase('banks'):
+        indexBanks(db, pinout)
+        checkBankVoltages(db)
+        if bank_table:
+            dumpBankTable(db, bank_table)
+    with profiler.phase('csv-merge'):
+        mergePackageCSV(db, pinout)
+    if csv_path or jsonl_path:
+        with profiler.phase('export'):
+            dumpPinDatabase(db, pinout, csv_path, jsonl_path)
+    with profiler.phase('emission'):
+        if sharded:
+            dumpShardedDeclarations(db, pinout, output_path, spec, all_capabilities, presolve_spec is not None)
+        else:
+            dumpPinAndPropertyDeclarations(db, output_path, spec, all_capabilities, presolve_spec is not None)
+    if presolve_spec:
+        with profiler.phase('presolve'):
+            presolvePins(db, pinout, presolve_spec, spec, all_capabilities)
+    db.counts['pins'] = len(db.props)
+    db.counts['conflicts'] = len(db.conflicts)
+    profiler.addCounts(db.counts)
+    return db
+
+class XDCWatcher(object):
+    # Keeps every xdc file's parsed properties and the package pinout in memory between generations.
+    # update() polls the files and re-parses only those added or modified since the last call, then merges
+    # everything again and regenerates; removed files just drop out.  run() reports a failed update and keeps
+    # polling, leaving the last good output in place until the files change again.
+    def __init__(self, root, csv_path, output_path=default_output_path, csv_dump=None, spec=XCKU060,
+                 cache=None, jobs=1, manifest_path=None, profile=False, all_capabilities=False, presolve_spec=None,
+                 bank_table=None, jsonl_dump=None, sharded=False):
+        self.root = root
+        self.csv_path = csv_path
+        self.output_path = output_path
+        self.csv_dump = csv_dump
+        self.spec = spec
+        self.cache = cache
+        self.jobs = jobs
+        self.manifest_path = manifest_path or manifestPath(output_path)
+        self.profile = profile
+        self.all_capabilities = all_capabilities
+        self.presolve_spec = presolve_spec
+        self.bank_table = bank_table
+        self.jsonl_dump = jsonl_dump
+        self.sharded = sharded
+        # fname => ((mtime in ns, size), props from parseXDCFile)
+        self.parsed = {}
+        self.pinout = None
+        self.pinout_stat = None
+        # The file stats the last update failed on, so a broken file is only retried once it is edited again
+        self.failed_state = None
+        self.csv_missing = False
+
+    def update(self):
+        # Returns whether anything changed (and so was regenerated)
+        profiler = PhaseProfiler(self.output_path) if self.profile else NullProfiler()
+        profiler.start()
+        with profiler.phase('discovery'):
+            found = scanFiles(self.root, '.xdc')
+            try:
+                st = os.stat(self.csv_path)
+                csv_stat = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                csv_stat = None
+        removed = [fname for fname in self.parsed if fname not in found]
+        changed = sorted(fname for fname, stat in found.items()
+                         if fname not in self.parsed or self.parsed[fname][0] != stat)
+        if not removed and not changed and csv_stat == self.pinout_stat:
+            return False
+        state = (found, csv_stat)
+        if state == self.failed_state:
+            return False
+        if csv_stat is None:
+            # Said once when it goes missing, xdc edits meanwhile are picked up once it is back
+            if not self.csv_missing:
+                print("%s is missing, waiting for it"%self.csv_path)
+                self.csv_missing = True
+            self.pinout_stat = None
+            return False
+        self.csv_missing = False
+        self.failed_state = state
+        for fname in removed:
+            print("Removed %s"%fname)
+            del self.parsed[fname]
+        db = PinDatabase()
+        with profiler.phase('tokenize'):
+            for fname, props, cached, counts in iterParsedXDCFiles(changed, self.cache, self.jobs):
+                self.parsed[fname] = (found[fname], props)
+                for name, n in counts.items():
+                    db.counts[name] += n
+            fnames = sorted(self.parsed)
+            owners = {}
+            for fname in fnames:
+                mergeProps(db, self.parsed[fname][1], fname, owners)
+            db.counts['xdc-files'] += len(changed)
+        if changed:
+            print("Parsed %s"%", ".join(changed))
+        if csv_stat != self.pinout_stat:
+            with profiler.phase('csv-read'):
+                self.pinout = PackagePinout(self.csv_path)
+            self.pinout_stat = csv_stat
+        processPins(db, self.pinout, self.output_path, self.csv_dump, self.spec, profiler, self.all_capabilities,
+                    self.presolve_spec, self.bank_table, self.jsonl_dump, self.sharded)
+        manifest = inputManifest(fnames, self.csv_path, self.spec, self.all_capabilities, self.presolve_spec,
+                                 self.sharded)
+        writeManifest(self.manifest_path, manifest,
+                      outputPaths(self.output_path, self.csv_dump, self.jsonl_dump, self.presolve_spec,
+                                  self.bank_table, self.sharded))
+        self.failed_state = None
+        profiler.stop()
+        if self.profile:
+            profiler.write(profilePaths(self.output_path)[0])
+        return True
+
+    def run(self, interval=0.5):
+        # Poll until interrupted
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    if self.update():
+                        print("Regenerated in %0.3fs, watching %s"%(time.perf_counter() - start, self.root))
+                except Exception as e:
+                    # e.g. a constraint the parser can't handle, or an IOSTANDARD missing from the iostandard table
+                    print("Regenerating failed, keeping the last output until a file changes: %s: %s"
+                          %(type(e).__name__, e))
+                sys.stdout.flush()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a pcb-component from Xilinx xdc constraint files")
+    parser.add_argument("xdc_dir", nargs="?", default=".", help="directory searched for *.xdc files")
+    parser.add_argument("--pkg-csv", default=default_csv_name, help="Xilinx ***pkg.csv package pinout")
+    parser.add_argument("-o", "--output", default=default_output_path, help="generated .stanza file")
+    parser.add_argument("--csv", default="out.csv", help="export of the merged pin database as csv, empty to skip")
+    parser.add_argument("--jsonl", help="also export the merged pin database as JSON lines, one pin per line")
+    parser.add_argument("--cache-dir", help="cache parsed xdc files here and only re-parse the ones that changed")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="xdc parsing worker processes, one per cpu by default")
+    parser.add_argument("--manifest", help="input hash manifest, <output>.manifest.json by default")
+    parser.add_argument("-f", "--force", action="store_true", help="regenerate even if the manifest says nothing changed")
+    parser.add_argument("--profile", action="store_true",
+                        help="write per-phase timings and counters to <output>.profile.json")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="with --profile, also dump cProfile stats of the run to <output>.prof")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running, regenerating whenever an xdc file or the pinout is added, changed or removed")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between polls in --watch mode")
+    parser.add_argument("--all-capabilities", action="store_true",
+                        help="declare every capability in interfaces.py each inferred bundle is structurally compatible with")
+    parser.add_argument("--presolve", metavar="REQUESTS",
+                        help="assign the capabilities requested in this file (see presolve.py) to pins and bundles up front "
+                        "and write the assignment out as supported-by statements")
+    parser.add_argument("--hints", help="package --presolve writes its supported-by statements to, "
+                        "<output without .stanza>-presolved.stanza by default")
+    parser.add_argument("--instance", default="fpga", help="name the --presolve requests use for the component instance")
+    parser.add_argument("--banks", metavar="CSV", help="write the per-bank VCCO summary of the constrained pins here")
+    parser.add_argument("--shard", action="store_true",
+                        help="split the component into a package per I/O bank in <output without .stanza>/ and a "
+                        "top-level package composing them, so that a change only recompiles the banks it touches; "
+                        "the shard files are compiled along with the output")
+    args = parser.parse_args(argv)
+
+    if args.shard:
+        try:
+            shardDirectory(args.output)
+        except ValueError as e:
+            parser.error("--shard: %s"%e)
+
+    presolve_spec = None
+    if args.presolve:
+        hints_path = args.hints or os.path.splitext(args.output)[0] + '-presolved.stanza'
+        try:
+            presolve_spec = PresolveSpec(args.presolve, hints_path, args.instance)
+        except OSError as e:
+            parser.error("can't read --presolve requests: %s"%e)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.watch:
+        cache = XDCCache(args.cache_dir) if args.cache_dir else None
+        watcher = XDCWatcher(args.xdc_dir, args.pkg_csv, args.output, args.csv, cache=cache, jobs=args.jobs,
+                             manifest_path=args.manifest, profile=args.profile, all_capabilities=args.all_capabilities,
+                             presolve_spec=presolve_spec, bank_table=args.banks, jsonl_dump=args.jsonl,
+                             sharded=args.shard)
+        watcher.run(args.interval)
+        return
+
+    if args.profile:
+        report_path, cprofile_path = profilePaths(args.output)
+        profiler = PhaseProfiler(args.output, cprofile_path if args.cprofile else None)
+    else:
+        profiler = NullProfiler()
+    profiler.start()
+    with profiler.phase('discovery'):
+        fnames = findXDCFiles(args.xdc_dir)
+        manifest_path = args.manifest or manifestPath(args.output)
+        manifest = inputManifest(fnames, args.pkg_csv, all_capabilities=args.all_capabilities,
+                                 presolve_spec=presolve_spec, sharded=args.shard)
+        output_args = (args.output, args.csv, args.jsonl, presolve_spec, args.banks, args.shard)
+    if not args.force and isUpToDate(manifest_path, manifest, outputPaths(*output_args)):
+        print("%s is up to date"%args.output)
+        profiler.count('up-to-date')
+    else:
+        cache = XDCCache(args.cache_dir) if args.cache_dir else None
+        with profiler.phase('csv-read'):
+            pinout = PackagePinout(args.pkg_csv)
+        generate(fnames, pinout, args.output, args.csv, cache=cache, jobs=args.jobs, profiler=profiler,
+                 all_capabilities=args.all_capabilities, presolve_spec=presolve_spec, bank_table=args.banks,
+                 jsonl_path=args.jsonl, sharded=args.shard)
+        # Listed again now the shards are written
+        writeManifest(manifest_path, manifest, outputPaths(*output_args))
+    profiler.stop()
+    if args.profile:
+        profiler.write(report_path)
+        print("Wrote %s"%report_path)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Opt-in phase timing and counters for the generator scripts
+#
+# A PhaseProfiler times each named phase of a run (wall clock and CPU, the CPU of worker processes
+# reaped during the phase included), collects work counters and writes both out as a JSON report.
+# Give it a cprofile_path to also run cProfile over the whole run and dump the stats there.
+# Scripts that weren't asked to profile use a NullProfiler, which has the same interface and does nothing.
+
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import cProfile
+import json
+import resource
+import sys
+import time
+from atomicfile import atomicWrite
+
+def childrenCPU():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class PhaseProfiler(object):
+    def __init__(self, name, cprofile_path=None):
+        self.name = name
+        # (phase name, wall seconds, cpu seconds) in the order the phases ran
+        self.phases = []
+        self.counts = defaultdict(int)
+        self.cprofile_path = cprofile_path
+        self.__cprofile = None
+        self.__start = None
+
+    def start(self):
+        self.__start = (time.perf_counter(), time.process_time() + childrenCPU())
+        if self.cprofile_path:
+            self.__cprofile = cProfile.Profile()
+            self.__cprofile.enable()
+
+    def stop(self):
+        if self.__cprofile is not None:
+            self.__cprofile.disable()
+            self.__cprofile.dump_stats(self.cprofile_path)
+            self.__cprofile = None
+
+    @contextmanager
+    def phase(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time() + childrenCPU()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - wall, time.process_time() + childrenCPU() - cpu))
+
+    def record(self, name, wall, cpu=None):
+        # A phase timed somewhere else, e.g. in a worker process
+        self.phases.append((name, wall, cpu))
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def addCounts(self, counts):
+        for name, n in counts.items():
+            self.counts[name] += n
+
+    def report(self):
+        rval = {'name': self.name,
+                'python': sys.version.split()[0],
+                'phases': [{'phase': name, 'wall': wall, 'cpu': cpu} for name, wall, cpu in self.phases],
+                'counts': dict(sorted(self.counts.items()))}
+        if self.__start is not None:
+            rval['wall'] = time.perf_counter() - self.__start[0]
+            rval['cpu'] = time.process_time() + childrenCPU() - self.__start[1]
+        if self.cprofile_path:
+            rval['cprofile'] = self.cprofile_path
+        return rval
+
+    def write(self, path):
+        # Atomic, so a dashboard never picks up half a report
+        with atomicWrite(path) as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
+
+class NullProfiler(object):
+    def start(self):
+        pass
+    def stop(self):
+        pass
+    def phase(self, name):
+        return nullcontext()
+    def record(self, name, wall, cpu=None):
+        pass
+    def count(self, name, n=1):
+        pass
+    def addCounts(self, counts):
+        pass
+
+def profilePaths(output_path):
+    # Where the report and the cProfile dump go for a given output file
+    return output_path + '.profile.json', output_path + '.prof'
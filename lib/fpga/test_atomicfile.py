@@ -0,0 +1,18 @@
+# Tests for atomicfile.py; run with python -m pytest from lib/fpga
+
+import os
+
+from atomicfile import atomicWrite
+
+def test_atomic_write_leaves_target_alone_on_error(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    with atomicWrite(path) as f:
+        f.write('old\n')
+    try:
+        with atomicWrite(path) as f:
+            f.write('half')
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert open(path).read() == 'old\n'
+    assert os.listdir(str(tmp_path)) == ['out.csv']
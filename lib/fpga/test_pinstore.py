@@ -0,0 +1,32 @@
+# Tests for the columnar pin property store in pinstore.py; run with python -m pytest from lib/fpga
+
+import pinstore
+
+def test_more_than_256_property_names():
+    table = pinstore.PinTable()
+    names = ['TEST_PROP_%u' % i for i in range(300)]
+    record = table[('led', 0)]
+    for i, name in enumerate(names):
+        record[name] = str(i)
+    assert all(pinstore.propertyId(name) >= 0 for name in names)
+    assert max(pinstore.propertyId(name) for name in names) >= 256
+    assert len(record) == 300
+    assert [k for k in record if k in names] == names
+    assert record[names[-1]] == '299'
+    assert names[-1] in record
+    assert 'TEST_PROP_MISSING' not in record
+
+    # A pin still holding a bytes order only has low ids, high ones are absent rather than an error
+    other = table[('led', 1)]
+    other['IOSTANDARD'] = 'LVCMOS18'
+    assert names[-1] not in other
+    assert other.get(names[-1]) is None
+    other[names[-1]] = 'x'
+    assert other[names[-1]] == 'x'
+
+    record[names[-1]] = 'changed'
+    assert len(record) == 300
+    del record[names[-1]]
+    assert names[-1] not in record
+    assert len(record) == 299
+    assert table.toDicts()[('led', 1)] == {'IOSTANDARD': 'LVCMOS18', names[-1]: 'x'}
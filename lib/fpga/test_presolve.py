@@ -0,0 +1,85 @@
+# Tests for the pin assignment pre-solver in presolve.py and the hints process_xdc.py writes from it;
+# run with python -m pytest from lib/fpga
+
+import re
+
+import presolve
+import process_xdc
+from test_process_xdc import packagePinout, parse
+
+def dioResource(name, **properties):
+    return presolve.SupportResource(name, [(name, None)], ['dio'],
+                                    dict((k, {v}) for k, v in properties.items()))
+
+def test_hopcroft_karp_augments_past_greedy_choice():
+    # Greedy gives left 0 right 0 and leaves left 1 nothing; the maximum matching moves left 0 to right 1
+    assert presolve.hopcroftKarp([[0, 1], [0]], 2) == [1, 0]
+    assert presolve.hopcroftKarp([[0], [0], []], 1) in ([0, None, None], [None, 0, None])
+
+def test_full_match():
+    resources = [dioResource('a', bank='44'), dioResource('b', bank='45'), dioResource('c', bank='44')]
+    requests = [presolve.CapabilityRequest('x', 'dio', {'bank': '44'}),
+                presolve.CapabilityRequest('y', 'dio', {}),
+                presolve.CapabilityRequest('z', 'dio', {'bank': '44'})]
+    assigned, unmatched = presolve.presolve(requests, resources)
+    assert unmatched == []
+    assert [request.ref for request, resource in assigned] == ['x', 'y', 'z']
+    assert len(set(resource.name for request, resource in assigned)) == 3
+    for request, resource in assigned:
+        assert resource.accepts(request)
+
+def test_unsatisfiable_requests_are_reported():
+    resources = [dioResource('a', voltage=1.8), dioResource('b', voltage=3.3)]
+    requests = [presolve.CapabilityRequest('led[%u]'%i, 'dio', {'voltage': 1.8}) for i in range(2)]
+    requests.append(presolve.CapabilityRequest('bus', 'spi', {}))
+    assigned, unmatched = presolve.presolve(requests, resources)
+    assert [(request.ref, resource.name) for request, resource in assigned] == [('led[0]', 'a')]
+    assert [request.ref for request in unmatched] == ['led[1]', 'bus']
+
+def test_read_requests(tmp_path):
+    path = tmp_path / 'requests.txt'
+    path.write_text("# comment\nled dio family=LVCMOS voltage=1.8 count=2\n\nlink lvds bank=44 # trailing\n")
+    requests = presolve.readRequests(str(path))
+    assert [(r.ref, r.capability, r.constraints) for r in requests] == [
+        ('led[0]', 'dio', {'family': 'LVCMOS', 'voltage': 1.8}),
+        ('led[1]', 'dio', {'family': 'LVCMOS', 'voltage': 1.8}),
+        ('link', 'lvds', {'bank': '44'})]
+
+xdc = ("set_property -dict {PACKAGE_PIN A1 IOSTANDARD LVDS} [get_ports clk_p]\n"
+       "set_property -dict {PACKAGE_PIN A2 IOSTANDARD LVDS} [get_ports clk_n]\n"
+       "set_property -dict {PACKAGE_PIN A3 IOSTANDARD LVCMOS18} [get_ports {led[0]}]\n"
+       "set_property -dict {PACKAGE_PIN A5 IOSTANDARD LVCMOS18} [get_ports {led[1]}]\n")
+
+# One statement of the ir-gen rule in src/ir/ir-gen-macros.stanza: required port <eref> supported-by <eref>
+eref = r'[A-Za-z][-A-Za-z0-9]*(?:\.[A-Za-z][-A-Za-z0-9]*|\[[0-9]+\])*'
+supported_by_re = re.compile(r'^    required (port|capability) (%s) supported-by (%s)$'%(eref, eref))
+
+def presolveFixture(tmp_path, requests):
+    (tmp_path / 'requests.txt').write_text(requests)
+    spec = presolve.PresolveSpec(str(tmp_path / 'requests.txt'), str(tmp_path / 'cmp-presolved.stanza'))
+    output = str(tmp_path / 'cmp.stanza')
+    db = process_xdc.processPins(parse(xdc), packagePinout(tmp_path), output, presolve_spec=spec)
+    return db, open(output).read(), open(spec.hints_path).read()
+
+def test_lvds_goes_to_a_diff_pair(tmp_path):
+    db, component, hints = presolveFixture(tmp_path, "link lvds\nlink2 lvds\nled dio count=2\n")
+    # Only clk is LVDS capable, the solo pins don't take the second lvds request
+    statements = [supported_by_re.match(line).groups() for line in hints.splitlines() if 'supported-by' in line]
+    assert statements[0] == ('port', 'fpga.link', 'fpga.clk-lvds')
+    assert [ref for port, ref, option in statements[1:]] == ['fpga.led[0]', 'fpga.led[1]']
+    assert all(option.endswith('-dio') for port, ref, option in statements[1:])
+    assert 'link2' not in hints
+    assert db.counts['presolve-unmatched'] == 1
+
+def test_hints_file_is_ir_gen_code(tmp_path):
+    db, component, hints = presolveFixture(tmp_path, "link lvds\nled dio count=2\n")
+    lines = hints.splitlines()
+    assert 'defpackage cmp-presolved :' in lines
+    assert '#use-added-syntax(ir-gen)' in lines
+    body = lines[lines.index('public defn presolved-fpga () :') + 1:]
+    assert body[0] == '  inside pcb-module :'
+    assert len(body) == 4
+    for line in body[1:]:
+        port, ref, option = supported_by_re.match(line).groups()
+        # Every option named is declared by the component
+        assert 'supports' in component and '(%s):'%option[len('fpga.'):] in component
@@ -0,0 +1,169 @@
+# Tests for the xdc parsing pipeline in process_xdc.py; run with python -m pytest from lib/fpga
+
+import io
+import os
+import sys
+
+import pytest
+
+import process_xdc
+
+def parse(text):
+    db = process_xdc.PinDatabase()
+    process_xdc.parseXDC(db, io.StringIO(text))
+    return db
+
+def packagePinout(tmp_path):
+    # A few pads of bank 44, its VCCO and a GT pad in bank 224, which has none
+    pkg = tmp_path / 'pkg.csv'
+    pkg.write_text("Pin,Pin Name,Memory Byte Group,Bank,I/O Type,Super Logic Region\n"
+                   "A1,IO_L1P_44,NA,44,HP,NA\n"
+                   "A2,IO_L1N_44,NA,44,HP,NA\n"
+                   "A3,IO_L2P_44,NA,44,HP,NA\n"
+                   "A5,IO_L2N_44,NA,44,HP,NA\n"
+                   "A6,IO_L3P_44,NA,44,HP,NA\n"
+                   "A7,IO_L3N_44,NA,44,HP,NA\n"
+                   "A4,VCCO_44,NA,44,NA,NA\n"
+                   "B1,MGTHRXP0_224,NA,224,GTH,NA\n")
+    return process_xdc.PackagePinout(str(pkg))
+
+def test_continuation_before_blank_line():
+    text = "set_property IOSTANDARD LVDS \\\n  [get_ports led]\n\\\n\n   \\\n"
+    assert list(process_xdc.readCommands(io.StringIO(text))) == ["set_property IOSTANDARD LVDS  [get_ports led]"]
+    db = parse(text)
+    assert db.props[('led', None)]['IOSTANDARD'] == 'LVDS'
+    assert db.counts['commands-read'] == 1
+
+def test_star_index_covers_unsubscripted_port():
+    db = parse("set_property PACKAGE_PIN A1 [get_ports {cb_ad[0]}]\n"
+               "set_property PACKAGE_PIN A2 [get_ports {cb_ad[1]}]\n"
+               "set_property PACKAGE_PIN A3 [get_ports cb_ad]\n"
+               "set_property PACKAGE_PIN A4 [get_ports {led[0]}]\n"
+               "set_property PACKAGE_PIN A5 [get_ports led]\n"
+               "set_property IOSTANDARD LVCMOS18 [get_ports {cb_ad[*]}]\n"
+               "set_property SLEW FAST [get_ports {led[?]}]\n")
+    process_xdc.expandWildcards(db)
+    for pinref in (('cb-ad', 0), ('cb-ad', 1), ('cb-ad', None)):
+        assert db.props[pinref]['IOSTANDARD'] == 'LVCMOS18'
+    # Only [*] takes in the unsubscripted port, [?] needs an index
+    assert db.props[('led', 0)]['SLEW'] == 'FAST'
+    assert 'SLEW' not in db.props[('led', None)]
+    assert not any(process_xdc.isPattern(pinref) for pinref in db.props)
+
+def test_fast_path_allows_spaces_inside_braces():
+    lines = ["set_property -dict { PACKAGE_PIN E3 IOSTANDARD LVCMOS33 } [get_ports { led_2 }]",
+             "set_property -dict { PACKAGE_PIN E4 IOSTANDARD LVCMOS33 } [get_ports { led[3] } ]",
+             "set_property IOSTANDARD LVCMOS18 [get_ports {  cb_ad[*]  }]"]
+    for l in lines:
+        assert process_xdc.set_property_re.match(l), l
+    fast = parse("\n".join(lines) + "\n")
+    assert fast.counts['fast-path'] == 3
+    assert fast.props[('led-2', None)]['PACKAGE_PIN'] == 'E3'
+    assert fast.props[('led', 3)]['IOSTANDARD'] == 'LVCMOS33'
+    assert fast.props[('cb-ad', '*')]['IOSTANDARD'] == 'LVCMOS18'
+    # Same result as the general tokenizer
+    slow = process_xdc.PinDatabase()
+    for l in lines:
+        process_xdc.handleSetProperty(slow, l, process_xdc.smartSplit(l))
+    assert slow.props.toDicts() == fast.props.toDicts()
+
+def test_banks_need_vcco_pads_and_lvds_needs_no_vcco(tmp_path):
+    pinout = packagePinout(tmp_path)
+    db = parse("set_property -dict {PACKAGE_PIN A1 IOSTANDARD LVDS} [get_ports clk_p]\n"
+               "set_property -dict {PACKAGE_PIN A2 IOSTANDARD LVDS} [get_ports clk_n]\n"
+               "set_property -dict {PACKAGE_PIN A3 IOSTANDARD LVCMOS33} [get_ports led]\n"
+               "set_property -dict {PACKAGE_PIN B1 IOSTANDARD SERDES} [get_ports rx]\n")
+    process_xdc.convertIOSTANDARD(db)
+    process_xdc.indexBanks(db, pinout)
+    assert list(db.banks) == ['44']
+    summary = db.banks['44']
+    assert summary.rail == 'vcco-44'
+    assert summary.pinCount() == 3
+    assert summary.vcco() == 3.3
+    assert process_xdc.checkBankVoltages(db) == []
+    assert db.counts['pins-no-vcco'] == 1
+
+def test_up_to_date_needs_every_output(tmp_path):
+    manifest_path = str(tmp_path / 'out.stanza.manifest.json')
+    stanza, csv, jsonl = [str(tmp_path / name) for name in ('out.stanza', 'out.csv', 'out.jsonl')]
+    for path in (stanza, csv):
+        open(path, 'w').write('generated\n')
+    manifest = {'inputs': {}}
+    process_xdc.writeManifest(manifest_path, manifest, process_xdc.outputPaths(stanza, csv))
+    assert process_xdc.isUpToDate(manifest_path, manifest, process_xdc.outputPaths(stanza, csv))
+    # An export asked for which the last run didn't write
+    assert not process_xdc.isUpToDate(manifest_path, manifest, process_xdc.outputPaths(stanza, csv, jsonl))
+    open(csv, 'w').write('edited\n')
+    assert not process_xdc.isUpToDate(manifest_path, manifest, process_xdc.outputPaths(stanza, csv))
+    process_xdc.writeManifest(manifest_path, manifest, process_xdc.outputPaths(stanza, csv))
+    os.remove(csv)
+    assert not process_xdc.isUpToDate(manifest_path, manifest, process_xdc.outputPaths(stanza, csv))
+
+def test_shards_are_outputs(tmp_path):
+    stanza = str(tmp_path / 'cmp.stanza')
+    assert process_xdc.outputPaths(stanza, sharded=True) == [stanza]
+    os.mkdir(str(tmp_path / 'cmp'))
+    for name in ('bank-44.stanza', 'other.stanza', 'notes.txt', 'handwritten.stanza'):
+        open(str(tmp_path / 'cmp' / name), 'w').close()
+    assert process_xdc.outputPaths(stanza, sharded=True) == [
+        stanza, str(tmp_path / 'cmp' / 'bank-44.stanza'), str(tmp_path / 'cmp' / 'other.stanza')]
+    assert process_xdc.outputPaths(stanza) == [stanza]
+    with pytest.raises(ValueError):
+        process_xdc.shardDirectory(str(tmp_path / 'cmp'))
+
+def test_shard_cleanup_only_removes_shards(tmp_path):
+    pinout = packagePinout(tmp_path)
+    os.mkdir(str(tmp_path / 'cmp'))
+    for name in ('bank-45.stanza', 'handwritten.stanza'):
+        open(str(tmp_path / 'cmp' / name), 'w').close()
+    db = parse("set_property -dict {PACKAGE_PIN A3 IOSTANDARD LVCMOS18} [get_ports led]\n")
+    process_xdc.processPins(db, pinout, str(tmp_path / 'cmp.stanza'), sharded=True)
+    fnames = os.listdir(str(tmp_path / 'cmp'))
+    assert 'bank-44.stanza' in fnames and 'handwritten.stanza' in fnames
+    assert 'bank-45.stanza' not in fnames
+
+def test_bare_and_indexed_port_generate(tmp_path):
+    # led and led[0] are both pins; sorting them must not compare None with 0
+    pinout = packagePinout(tmp_path)
+    text = ("set_property -dict {PACKAGE_PIN A3 IOSTANDARD LVCMOS18} [get_ports {led[0]}]\n"
+            "set_property -dict {PACKAGE_PIN A5 IOSTANDARD LVCMOS18} [get_ports led]\n")
+    outputs = []
+    for sharded in (False, True):
+        output = str(tmp_path / ('sharded.stanza' if sharded else 'cmp.stanza'))
+        process_xdc.processPins(parse(text), pinout, output, sharded=sharded)
+        outputs.append(open(output).read())
+    assert outputs[0].index('pin led\n') < outputs[0].index('pin led-0\n')
+    shard = open(str(tmp_path / 'sharded' / 'bank-44.stanza')).read()
+    assert shard.index('pin led\n') < shard.index('pin led-0\n')
+
+def test_infer_bundles():
+    lines = ["set_property IOSTANDARD LVDS [get_ports clk_P]",
+             "set_property IOSTANDARD LVDS [get_ports clk_N]"]
+    for member in ('txd', 'rxd'):
+        lines += ["set_property IOSTANDARD LVCMOS18 [get_ports {eth_%s[%u]}]"%(member, i) for i in range(4)]
+    for member in ('tx_clk', 'tx_ctrl', 'rx_clk', 'rx_ctrl'):
+        lines.append("set_property IOSTANDARD LVCMOS18 [get_ports eth_%s]"%member)
+    # Half a pair, an i2c bus missing sda and a name with no known suffix stay solo pins
+    lines += ["set_property IOSTANDARD LVDS [get_ports orphan_p]",
+              "set_property IOSTANDARD LVCMOS18 [get_ports sensor_scl]",
+              "set_property IOSTANDARD LVCMOS18 [get_ports led]"]
+    db = parse("\n".join(lines) + "\n")
+    process_xdc.inferBundles(db)
+    assert db.bundles['diff-pair'] == {('clk', None): {('clk-p', None), ('clk-n', None)}}
+    assert db.pin_bundles[('clk-n', None)] == ('diff-pair', ('clk', None), 'D_N')
+    assert list(db.bundles['rgmii']) == [('eth', None)]
+    assert len(db.bundles['rgmii'][('eth', None)]) == 12
+    assert db.pin_bundles[('eth-txd', 2)] == ('rgmii', ('eth', None), 'txd[2]')
+    assert process_xdc.pinrefToName(db, ('eth-rx-ctrl', None)) == 'eth.rx-ctrl'
+    assert db.bundles['i2c'] == {}
+    for pinref in (('orphan-p', None), ('sensor-scl', None), ('led', None)):
+        assert pinref not in db.pin_bundles
+    assert db.counts['bundles-inferred'] == 2
+
+def test_generator_sources_cover_local_imports():
+    # Every module process_xdc imports from lib/fpga is hashed into the manifest
+    here = os.path.dirname(os.path.abspath(process_xdc.__file__))
+    imported = set(os.path.abspath(module.__file__) for module in sys.modules.values()
+                   if getattr(module, '__file__', None) and os.path.dirname(os.path.abspath(module.__file__)) == here
+                   and not os.path.basename(module.__file__).startswith('test_'))
+    assert imported <= set(os.path.abspath(path) for path in process_xdc.generator_sources)
@@ -0,0 +1,30 @@
+# Indented line writer for the generated stanza code, shared by process_xdc.py and gen-bypass.py
+# Lines are collected in memory and handed to the file in one write by flush() (or taken with getvalue())
+
+class Writer(object):
+    def __init__(self, file=None):
+        self.file = file
+        self.lines = []
+        self.__indent = 0
+        self.__prefix = ''
+    def writeLine(self, *args):
+        self.lines.append(self.__prefix + ''.join([str(arg) for arg in args]))
+    def printLine(self, *args):
+        # Same text print(indent, *args) would produce: arguments separated by spaces, one after the indent too
+        self.lines.append(' '.join([self.__prefix] + [str(arg) for arg in args]))
+    def indent(self):
+        self.__indent += 1
+        self.__prefix = '  '*self.__indent
+    def unindent(self):
+        self.__indent -= 1
+        self.__prefix = '  '*self.__indent
+    def getvalue(self):
+        if not self.lines:
+            return ''
+        return '\n'.join(self.lines) + '\n'
+    def flush(self, file=None):
+        # Write everything buffered so far in a single call
+        if file is None:
+            file = self.file
+        file.write(self.getvalue())
+        self.lines = []
@@ -3,9 +3,62 @@
 # PCBBundle is a Python DataClass
 # https://docs.python.org/3/library/dataclasses.html
 
+from functools import lru_cache
+from typing import Tuple, Type, get_args, get_origin
+import re
+
+class Pin(object):
+  """A single pin, the leaf of every bundle"""
+
+def field_paths(t: Type, prefix: str):
+  """(leaf pin paths, "path:Type" nested bundle paths) of a field of type t called prefix"""
+  if t is Pin:
+    return (prefix,), ()
+  if get_origin(t) is tuple:
+    pins, bundles = (), ()
+    for i, element in enumerate(get_args(t)):
+      p, b = field_paths(element, "%s[%u]" % (prefix, i))
+      pins += p
+      bundles += b
+    return pins, bundles
+  # Bundles are flattened when they're created, so this never goes deeper than one level
+  return (tuple(prefix + "." + p for p in t.pin_paths),
+          (prefix + ":" + t.__name__,) + tuple(prefix + "." + b for b in t.bundle_paths))
+
+class PCBBundle(object):
+  """Pins and sub-bundles declared as annotated fields, like a dataclass.
+  Each subclass is flattened once when it's created:
+    pin_paths     leaf pin paths in field order, e.g. ("tx.D_P", "tx.D_N", "rx.D_P", "rx.D_N")
+    pin_offsets   path => offset into pin_paths
+    bundle_paths  "path:Type" of every nested bundle, e.g. ("tx:DiffPair", "rx:DiffPair")"""
+  fields = {}
+  pin_paths = ()
+  pin_offsets = {}
+  bundle_paths = ()
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    cls.fields = dict(cls.__dict__.get("__annotations__", {}))
+    pins, bundles = (), ()
+    for name, t in cls.fields.items():
+      p, b = field_paths(t, name)
+      pins += p
+      bundles += b
+    cls.pin_paths = pins
+    cls.pin_offsets = dict((path, i) for i, path in enumerate(pins))
+    cls.bundle_paths = bundles
+
+@lru_cache(maxsize=None)
 def N(t: Type, n: int):
-    """FIXME: Make Type[4] == Tuple[Type, Type, Type, Type]"""
-    return eval("Tuple["+(t.__name__+", ")*n-1+t.__name__+"]")
+  """Type[4] == Tuple[Type, Type, Type, Type], built once per (type, length)"""
+  return Tuple[(t,)*n]
+
+def make_bundle(name: str, pins):
+  """Bundle class called name with a Pin field for each of pins, built without generating source"""
+  return type(name, (PCBBundle,), {"__annotations__": dict((p, Pin) for p in pins), "__module__": __name__})
+
+class DiffPair(PCBBundle):
+  D_P: Pin
+  D_N: Pin
 
 class Power(PCBBundle):
   pos: Pin
@@ -58,11 +111,9 @@ class i2c(PCBBundle):
   scl: Pin
 
 #val spi_bundles: HashTable<Symbol, Seqable>()
+spi_bundles = {}
 def generate_spi_bundles():
-  prefix = "spi_"
-  m_or_s = ["master_", "slave"]
-  dir    = ["bi"     , "in"   , "out"]
-  common_pins: ["ss", "sck"]
+  common_pins = ["ss", "sck"]
   spi_bundles["spi_master"]    = common_pins + ["mosi", "miso"]
   spi_bundles["spi_master_in"] = common_pins + ["miso"]
   spi_bundles["spi_master_out"]= common_pins + ["mosi"]
@@ -70,14 +121,7 @@ def generate_spi_bundles():
   spi_bundles["spi_slave_in"]  = common_pins + ["mosi"]
   spi_bundles["spi_slave_out"] = common_pins + ["miso"]
   for k, v in spi_bundles.items():
-    s = """\
-class {}(PCBBundle):
-"""
-    for pname in v:
-      s += """\
-  {}: Pin
-"""
-    exec(s)
+    globals()[k] = make_bundle(k, v)
 generate_spi_bundles()
 
 class SPI(PCBBundle):
@@ -96,10 +140,6 @@ class SWD(PCBBundle):
   reset: Pin
   swo:   Pin
 
-class DiffPair(PCBBundle):
-  D_P: Pin
-  D_N: Pin
-
 class edp(PCBBundle):
   Power_3v3: Power
   Power_19v0: Power
@@ -165,56 +205,94 @@ class ethernet_1000(PCBBundle):
 #public val CAPABILITY_TABLE: HashTable<Symbol, Symbol>()
 
 #CAPABILITY_TABLE = Dict[str, PCBBundle]
-
-CAPABILITY_TABLE["Power_3v0_source"] = Power
-CAPABILITY_TABLE["Power_3v0"] = Power
-CAPABILITY_TABLE["Power_3v3_source"] = Power
-CAPABILITY_TABLE["Power_3v3"] = Power
-CAPABILITY_TABLE["Power_5v0_source"] = Power
-CAPABILITY_TABLE["Power_5v0"] = Power
-CAPABILITY_TABLE["Power_7v4_source"] = Power
-CAPABILITY_TABLE["Power_7v4"] = Power
-CAPABILITY_TABLE["Power_12v0_source"] = Power
-CAPABILITY_TABLE["Power_12v0"] = Power
-CAPABILITY_TABLE["Power_48v0_source"] = Power
-CAPABILITY_TABLE["Power_48v0"] = Power
-CAPABILITY_TABLE["Power_batt_source"] = Power
-CAPABILITY_TABLE["Power_batt"] = Power
-CAPABILITY_TABLE["Power_ref_source"] = Power
-CAPABILITY_TABLE["Power_ref"] = Power
-CAPABILITY_TABLE["Power_source"] = Power
-CAPABILITY_TABLE["Power"] = Power
-
-CAPABILITY_TABLE["adc"] = Pin
-CAPABILITY_TABLE["dac"] = Pin
-CAPABILITY_TABLE["pwm"] = Pin
-CAPABILITY_TABLE["dio"] = Pin
-CAPABILITY_TABLE["reset"] = Pin
-CAPABILITY_TABLE["ext_int"] = Pin
-CAPABILITY_TABLE["edio"] = Pin
-CAPABILITY_TABLE["iv_sense"] = IVSense
-CAPABILITY_TABLE["pass"] = Pin
-CAPABILITY_TABLE["uart"] = UART
-CAPABILITY_TABLE["fullduplex_uart_w_enable"] = FullDuplexUARTWithEnable
-#CAPABILITY_TABLE["rs485"] = rs485
-CAPABILITY_TABLE["sd"] = sd
-CAPABILITY_TABLE["jtag"] = jtag
-CAPABILITY_TABLE["jtag_no_rst"] = jtag_no_rst
-CAPABILITY_TABLE["can"] = can
-CAPABILITY_TABLE["i2c"] = i2c
-CAPABILITY_TABLE["i2c_0"] = i2c
-CAPABILITY_TABLE["spi"] = spi
-for spi_name in spi_bundles.keys():
-  CAPABILITY_TABLE[spi_name] =  spi_name
-CAPABILITY_TABLE["usb_2"] = usb_2
-CAPABILITY_TABLE["swd"] = swd
-CAPABILITY_TABLE["DiffPair"] = DiffPair
-CAPABILITY_TABLE["edp"] = edp
-#CAPABILITY_TABLE["LVDS"] = `LVDS
-CAPABILITY_TABLE["LVDS_clk"] = LVDS_clk
-CAPABILITY_TABLE["pcie_lane"] = pcie_lane
-# Dummy capabiltiy for crossbar use
-CAPABILITY_TABLE["bar_pin"] = Pin
+# Built on first access of interfaces.CAPABILITY_TABLE, see __getattr__ below
+
+@lru_cache(maxsize=None)
+def capability_table():
+  CAPABILITY_TABLE = {}
+  add_capabilities(CAPABILITY_TABLE)
+  return CAPABILITY_TABLE
+
+def __getattr__(name):
+  if name == "CAPABILITY_TABLE":
+    return capability_table()
+  raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def add_capabilities(CAPABILITY_TABLE):
+  CAPABILITY_TABLE["Power_3v0_source"] = Power
+  CAPABILITY_TABLE["Power_3v0"] = Power
+  CAPABILITY_TABLE["Power_3v3_source"] = Power
+  CAPABILITY_TABLE["Power_3v3"] = Power
+  CAPABILITY_TABLE["Power_5v0_source"] = Power
+  CAPABILITY_TABLE["Power_5v0"] = Power
+  CAPABILITY_TABLE["Power_7v4_source"] = Power
+  CAPABILITY_TABLE["Power_7v4"] = Power
+  CAPABILITY_TABLE["Power_12v0_source"] = Power
+  CAPABILITY_TABLE["Power_12v0"] = Power
+  CAPABILITY_TABLE["Power_48v0_source"] = Power
+  CAPABILITY_TABLE["Power_48v0"] = Power
+  CAPABILITY_TABLE["Power_batt_source"] = Power
+  CAPABILITY_TABLE["Power_batt"] = Power
+  CAPABILITY_TABLE["Power_ref_source"] = Power
+  CAPABILITY_TABLE["Power_ref"] = Power
+  CAPABILITY_TABLE["Power_source"] = Power
+  CAPABILITY_TABLE["Power"] = Power
+
+  CAPABILITY_TABLE["adc"] = Pin
+  CAPABILITY_TABLE["dac"] = Pin
+  CAPABILITY_TABLE["pwm"] = Pin
+  CAPABILITY_TABLE["dio"] = Pin
+  CAPABILITY_TABLE["reset"] = Pin
+  CAPABILITY_TABLE["ext_int"] = Pin
+  CAPABILITY_TABLE["edio"] = Pin
+  CAPABILITY_TABLE["iv_sense"] = IVSense
+  CAPABILITY_TABLE["pass"] = Pin
+  CAPABILITY_TABLE["uart"] = UART
+  CAPABILITY_TABLE["fullduplex_uart_w_enable"] = FullDuplexUARTWithEnable
+  #CAPABILITY_TABLE["rs485"] = rs485
+  CAPABILITY_TABLE["sd"] = sd
+  CAPABILITY_TABLE["jtag"] = jtag
+  CAPABILITY_TABLE["jtag_no_rst"] = jtag_no_rst
+  CAPABILITY_TABLE["can"] = can
+  CAPABILITY_TABLE["i2c"] = i2c
+  CAPABILITY_TABLE["i2c_0"] = i2c
+  CAPABILITY_TABLE["spi"] = SPI
+  for spi_name in spi_bundles.keys():
+    CAPABILITY_TABLE[spi_name] = globals()[spi_name]
+  CAPABILITY_TABLE["usb_2"] = USB_2
+  CAPABILITY_TABLE["swd"] = SWD
+  CAPABILITY_TABLE["DiffPair"] = DiffPair
+  CAPABILITY_TABLE["edp"] = edp
+  #CAPABILITY_TABLE["LVDS"] = `LVDS
+  CAPABILITY_TABLE["LVDS_clk"] = LVDS_clk
+  CAPABILITY_TABLE["pcie_lane"] = pcie_lane
+  # Dummy capabiltiy for crossbar use
+  CAPABILITY_TABLE["bar_pin"] = Pin
+
+#==== Structural signatures ====================================================
+
+@lru_cache(maxsize=None)
+def signature(t: Type):
+  """What a pin group has to look like to implement t, whatever t is called: its sorted pin and bundle paths"""
+  if t is Pin:
+    return ("",)
+  return tuple(sorted(t.pin_paths + t.bundle_paths))
+
+@lru_cache(maxsize=None)
+def capability_index():
+  """signature => names of every capability in CAPABILITY_TABLE with that structure"""
+  index = {}
+  for name, t in capability_table().items():
+    index.setdefault(signature(t), set()).add(name)
+  return index
+
+def capabilities_for(sig):
+  """Capability names a pin group with signature sig can support, sorted"""
+  return sorted(capability_index().get(sig, ()))
+
+def stanza_name(name: str):
+  """Capability or bundle name as interfaces.stanza spells it, e.g. DiffPair => diff-pair, LVDS_clk => lvds-clk"""
+  return re.sub(r"([a-z0-9])([A-Z])", r"\1-\2", name).replace("_", "-").lower()
 
 #for e in CAPABILITY_TABLE:
 #  if value(e) == `: = Pin